@@ -0,0 +1,52 @@
+'''
+import time of the numeric core against the gui stack
+
+every entry is imported in a fresh interpreter, repeat times, and the median
+is reported; the numeric core does not import PyQt5, matplotlib or scipy,
+data_analysis_nsor only imports PyQt5 until a MainWindow is made
+
+    python benchmark_import.py
+    python benchmark_import.py --repeat 20
+'''
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+IMPORTS = [
+    ('python', ''),
+    ('numpy', 'numpy'),
+    ('core (loader, fft, phase, integral)', 'nsor_data, nsor_cache, nsor_fft, nsor_phase, nsor_window'),
+    ('pipeline', 'nsor_pipeline'),
+    ('gui module, no window', 'data_analysis_nsor'),
+    ('gui stack (PyQt5 + matplotlib qt)', 'PyQt5.QtWidgets, matplotlib.backends.backend_qt5agg, matplotlib.figure'),
+]
+
+TIMER = 'import time; t = time.perf_counter(); {}; print(time.perf_counter() - t)'
+
+
+def import_time(modules, repeat):
+    '''
+    median seconds of importing modules (comma separated) in a new interpreter
+    '''
+    code = TIMER.format(f'import {modules}' if modules else 'pass')
+    folder = os.path.dirname(os.path.realpath(__file__))
+    times = []
+    for i in range(repeat):
+        output = subprocess.run([sys.executable, '-c', code], cwd=folder, check=True,
+                                capture_output=True, text=True).stdout
+        times.append(float(output.split()[-1]))
+    return statistics.median(times)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='import time of the numeric core and the gui')
+    parser.add_argument('--repeat', type=int, default=5, help='fresh interpreters per entry')
+    args = parser.parse_args(argv)
+    for name, modules in IMPORTS:
+        print('{:40s} {:8.1f} ms'.format(name, import_time(modules, args.repeat)*1e3))
+
+
+if __name__ == '__main__':
+    main()
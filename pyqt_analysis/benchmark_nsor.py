@@ -0,0 +1,230 @@
+'''
+benchmark of the load -> window -> fft -> phase -> integral -> draw path
+
+synthetic fids (decaying cosine plus noise, as icons/generate_waveform.py)
+are written as bin files of 10^4 .. 10^7 samples (--sizes up to 10^8 and
+beyond), every stage runs on them as the gui does, the time cursor spanning
+the whole trace, for each zerofilling x1..x8:
+
+    load         AcquisitionFile, what open_file does before the fft
+    window       cursor window copied out of the file and zero filled (zero_padding)
+    fft          backend spectrum of the zero filled window (FourierWorker.run)
+    auto_phase   closed form 0th order phase of the freq cursor window (auto_phase)
+    entropy      0th + 1st order entropy phase search of the visible band (auto_phase, 1st order on)
+    phase        one slider tick, phased spectrum and its integral (zeroth_order_phase)
+    integrate    prefix sums of a new spectrum and the cursor integral (cursor_operation)
+    draw_time    decimated time trace drawn on an agg canvas (draw('time'))
+    draw_freq    decimated |spectrum| drawn on an agg canvas (draw('freq'))
+
+the latency percentiles, throughput (input samples per second) and peak
+memory (numpy allocations, tracemalloc) of every stage are printed and saved
+as json, --compare prints the ratio to an earlier run:
+
+    python benchmark_nsor.py -o before.json
+    python benchmark_nsor.py -o after.json --compare before.json
+    python benchmark_nsor.py --sizes 1e6 1e8 --zero-fill x1 x4 --repeat 3
+'''
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from numpy import pi
+
+from nsor_data import AcquisitionFile, index_range
+from nsor_fft import FFTBackend, zero_fill_length
+from nsor_phase import PhaseCorrector, WindowIntegral, auto_phase_entropy, auto_phase_zeroth
+from nsor_window import Apodizer
+
+SIZES = [10**4, 10**5, 10**6, 10**7]
+ZERO_FILLS = ['x1', 'x2', 'x4', 'x8']
+DT = 1e-5 # s, sampling step of the synthetic fids
+FREQUENCY = 31200 # Hz, inside the default freq cursors
+FREQ_CURSOR = [31100, 31300]
+FREQ_LIMIT = [31000, 31400] # visible band, scored by the entropy search
+CHUNK = 1 << 22 # samples generated and written at a time
+PERCENTILES = [50, 90, 99]
+
+
+def write_fid(file_name, n, dt=DT, chunk=CHUNK, seed=0):
+    '''
+    bin file of n samples of a decaying cosine with noise, written in chunks
+    so that 10^8 samples do not need the whole trace in memory
+    '''
+    rng = np.random.default_rng(seed)
+    t2 = n*dt/4
+    with open(file_name, 'wb') as f:
+        for start in range(0, n, chunk):
+            t = (start + np.arange(min(chunk, n - start)))*dt
+            records = np.empty((len(t), 2), dtype='>f8')
+            records[:, 0] = t
+            records[:, 1] = np.cos(2*pi*FREQUENCY*t)*np.exp(-t/t2) + 0.01*rng.standard_normal(len(t))
+            records.tofile(f)
+
+
+def measure(function, repeat):
+    '''
+    latencies (s) of repeat calls of function and the peak memory (bytes)
+    allocated during one call, function is called once before as warm up
+    '''
+    function()
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    latencies = []
+    for i in range(repeat):
+        t = time.perf_counter()
+        function()
+        latencies.append(time.perf_counter() - t)
+    return latencies, peak
+
+
+def record(stage, n, zero_fill, latencies, peak):
+    result = {'stage': stage, 'samples': n, 'zero_fill': zero_fill}
+    for p in PERCENTILES:
+        result[f'p{p}_ms'] = float(np.percentile(latencies, p))*1e3
+    result['throughput'] = n/float(np.median(latencies)) # input samples per second
+    result['peak_mb'] = peak/2**20
+    return result
+
+
+def draw_canvas():
+    '''
+    agg canvas of the gui size with the decimated line of nsor_render, None
+    without matplotlib
+    '''
+    try:
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+        from nsor_render import DecimatedLine
+    except ImportError:
+        return None
+    canvas = FigureCanvasAgg(Figure(figsize=(8, 4), dpi=100))
+    ax = canvas.figure.add_subplot(111)
+    return canvas, ax, DecimatedLine(ax)
+
+
+def benchmark_size(file_name, n, zero_fills, repeat, backend, draw=True):
+    '''
+    records of every stage for one file of n samples
+    '''
+    results = []
+    def add(stage, zero_fill, function):
+        results.append(record(stage, n, zero_fill, *measure(function, repeat)))
+        print('{:10s} {:>10d} {:>4s} {:10.2f} ms'.format(stage, n, zero_fill or '', results[-1]['p50_ms']))
+
+    add('load', None, lambda: AcquisitionFile(file_name).time_axis)
+    acquisition = AcquisitionFile(file_name)
+    canvas = draw_canvas() if draw else None
+    if canvas is not None:
+        canvas, ax, line = canvas
+        def draw_time():
+            line.set_data(acquisition.time_axis, acquisition.y)
+            ax.relim()
+            ax.autoscale_view()
+            canvas.draw()
+        add('draw_time', None, draw_time)
+
+    cs1, cs2 = index_range(acquisition.time_axis, acquisition.time_axis[len(acquisition)//50], acquisition.time_axis[-1])
+    apodizer = Apodizer()
+    for zero_fill in zero_fills:
+        l = zero_fill_length(cs2-cs1, int(zero_fill[1:]))
+        add('window', zero_fill, lambda: apodizer(acquisition.y, cs1, cs2, l)) # the copy out of the file every time
+        time_sig = apodizer(acquisition.y, cs1, cs2, l)
+        add('fft', zero_fill, lambda: backend.spectrum(time_sig, acquisition.f_max))
+        freq_x, freq_y = backend.spectrum(time_sig, acquisition.f_max)
+        csL, csR = index_range(freq_x, *FREQ_CURSOR)
+        add('auto_phase', zero_fill, lambda: auto_phase_zeroth(freq_y, csL, csR))
+        band = index_range(freq_x, *FREQ_LIMIT)
+        add('entropy', zero_fill, lambda: auto_phase_entropy(freq_y, csL, csR, band=band))
+        phase = PhaseCorrector()
+        phase.set_spectrum(freq_y)
+        integral = WindowIntegral()
+        integral.set_spectrum(freq_y)
+        add('phase', zero_fill, lambda: (phase.apply(0.5), integral.phased(csL, csR, 0.5)))
+        add('integrate', zero_fill, lambda: (integral.set_spectrum(freq_y), integral.magnitude(csL, csR)))
+        if canvas is not None:
+            def draw_freq():
+                line.set_data(freq_x, np.abs(freq_y))
+                ax.relim()
+                ax.autoscale_view()
+                canvas.draw()
+            add('draw_freq', zero_fill, draw_freq)
+    return results
+
+
+def run(sizes=SIZES, zero_fills=ZERO_FILLS, repeat=5, backend_name=None, folder=None, draw=True):
+    '''
+    benchmark every size, the synthetic files are written to folder (a
+    temporary directory if None) and removed afterwards
+    '''
+    backend = FFTBackend(backend_name)
+    with tempfile.TemporaryDirectory(dir=folder) as folder:
+        results = []
+        for n in sizes:
+            file_name = os.path.join(folder, f'NMR_sig_{n}')
+            write_fid(file_name, n)
+            results += benchmark_size(file_name, n, zero_fills, repeat, backend, draw)
+            os.remove(file_name)
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'backend': backend.name,
+        'repeat': repeat,
+        'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'results': results,
+    }
+
+
+def compare(report, reference):
+    '''
+    print p50 latency and peak memory relative to a reference report,
+    ratios above 1 are slower / larger
+    '''
+    old = {(r['stage'], r['samples'], r['zero_fill']): r for r in reference['results']}
+    print('{:10s} {:>10s} {:>4s} {:>10s} {:>10s} {:>8s} {:>8s}'.format(
+          'stage', 'samples', 'zf', 'p50 ms', 'ref ms', 'time', 'memory'))
+    for r in report['results']:
+        o = old.get((r['stage'], r['samples'], r['zero_fill']))
+        if o is None:
+            continue
+        print('{:10s} {:>10d} {:>4s} {:10.2f} {:10.2f} {:8.2f} {:8.2f}'.format(
+              r['stage'], r['samples'], r['zero_fill'] or '', r['p50_ms'], o['p50_ms'],
+              r['p50_ms']/o['p50_ms'] if o['p50_ms'] else np.nan,
+              r['peak_mb']/o['peak_mb'] if o['peak_mb'] else np.nan))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='benchmark of load, fft, phase, integral and draw on synthetic fids')
+    parser.add_argument('--sizes', nargs='+', type=float, default=SIZES, help='samples per fid, e.g. 1e4 1e8')
+    parser.add_argument('--zero-fill', nargs='+', choices=ZERO_FILLS, default=ZERO_FILLS)
+    parser.add_argument('--repeat', type=int, default=5, help='timed calls per stage')
+    parser.add_argument('--backend', help='fft library, pyfftw, scipy or numpy')
+    parser.add_argument('--folder', help='where the synthetic files are written, a temporary directory by default')
+    parser.add_argument('--no-draw', action='store_true', help='skip the matplotlib stages')
+    parser.add_argument('-o', '--output', help='json file for the results')
+    parser.add_argument('--compare', help='json file of an earlier run to compare with')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run([int(n) for n in args.sizes], args.zero_fill, args.repeat, args.backend,
+                 args.folder, not args.no_draw)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            compare(report, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,13 +2,6 @@ from PyQt5.QtGui import *
 from PyQt5.QtWidgets import *
 from PyQt5.QtCore import *
 
-from matplotlib.backends.qt_compat import QtCore, QtWidgets
-from matplotlib.backends.backend_qt5agg import (
-        FigureCanvas, NavigationToolbar2QT as NavigationToolbar)
-from matplotlib.figure import Figure
-import matplotlib
-from matplotlib.ticker import FormatStrFormatter
-
 import sys
 import os
 
@@ -19,8 +12,28 @@ import json
 
 import time
 
+from nsor_average import average_files
+from nsor_cache import CachedAcquisition, SidecarCache
+from nsor_data import AcquisitionFile, UniformAxis, index_range
+from nsor_fft import ZERO_FILL_MODES, ZOOM_POINTS, FFTBackend, SpectrumCache, available_backends, zero_fill_length
+from nsor_pipeline import PROCESSING_KEYS, read_settings
+from nsor_phase import PhaseCorrector, WindowIntegral, auto_phase_entropy, auto_phase_zeroth
+from nsor_profile import STAGES, profiler, span
+from nsor_stream import RingBuffer, open_source
+from nsor_window import WINDOWS, Apodizer
+
+PHASE_FRAME = 16 # ms, phase slider ticks are coalesced into at most one redraw per frame
+EDIT_DELAY = 50 # ms, edits of a MyLineEdit settle this long before they are acted on
+STREAM_FRAME = 100 # ms, live streams are polled and the time plot redrawn at most once per frame
+STREAM_FFT_INTERVAL = 0.25 # s, minimum time between two spectra of a live stream
+PROFILE_FRAME = 1000 # ms, refresh interval of the timing histograms
+HISTOGRAM_BINS = np.logspace(-3, 4, 57) # ms, 1 us to 10 s, 8 bins per decade
+PHASE1_GRID = np.linspace(-2*pi, 2*pi, 73) # rad, 1st order auto phase candidates, the range of first_slider
+PHASE1_MIN_TURN = 5/180*pi # rad, smaller 1st order turns across the visible band are left to the 0th order
+
 BASE_FOLDER = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
 PARAMETER_FILE = BASE_FOLDER + r'\pyqt_analysis\parameters.txt'
+WISDOM_FILE = BASE_FOLDER + r'\pyqt_analysis\fftw_wisdom.pickle'
 
 def read_parameter(parameter_file):
     with open(parameter_file, 'r') as f:
@@ -39,21 +52,129 @@ def save_parameter(parameter_file, **kwargs):
 Multithreading preparation
 '''
 class WorkerSignals(QObject):
-    finished = pyqtSignal()
+    finished = pyqtSignal(int) # generation
     data = pyqtSignal(tuple)
+    error = pyqtSignal(tuple) # (generation, message)
 
 class FourierWorker(QRunnable): #Multithreading
-    def __init__(self, time_data_y, f_max):
+    def __init__(self, time_data_y, f_max, backend, generation=0, is_current=None, band=None):
         super(FourierWorker,self).__init__()
         self.f_max = f_max
         self.time_data_y = time_data_y
+        self.backend = backend # nsor_fft.FFTBackend
+        self.band = band # (f_start, f_stop, points) for a zoom fft, None for the full spectrum
+        self.generation = generation
+        self.is_current = is_current # callable(generation), a superseded job skips the fft
         self.signals = WorkerSignals()
     @pyqtSlot()
     def run(self):
-        self.freq_data_y = np.fft.rfft(self.time_data_y)/len(self.time_data_y)*2
-        self.freq_data_x = np.linspace(0, self.f_max, int(len(self.time_data_y)/2)+1)
-        self.signals.data.emit((self.freq_data_x,self.freq_data_y))
-        self.signals.finished.emit()
+        try:
+            if self.is_current is None or self.is_current(self.generation):
+                self.fft_time = time.perf_counter()
+                with span('fft'):
+                    if self.band is None:
+                        self.freq_data_x, self.freq_data_y = self.backend.spectrum(self.time_data_y, self.f_max)
+                    else:
+                        self.freq_data_x, self.freq_data_y = self.backend.zoom_spectrum(self.time_data_y, self.f_max, *self.band)
+                self.fft_time = time.perf_counter() - self.fft_time
+                self.signals.data.emit((self.freq_data_x,self.freq_data_y,self.generation,self.fft_time))
+        except Exception as e: # raised on a pool thread it would abort the gui
+            self.signals.error.emit((self.generation, f'{type(e).__name__}: {e}'))
+        finally:
+            self.signals.finished.emit(self.generation)
+
+class AverageSignals(QObject):
+    progress = pyqtSignal(int, float) # (scans averaged, snr)
+    result = pyqtSignal(object) # nsor_average.RunningAverage
+    error = pyqtSignal(str)
+
+class AverageWorker(QRunnable):
+    '''
+    average_files on a pool thread, the gui stays responsive while the scans
+    are read and added
+    '''
+    def __init__(self, file_names, settings, align_phase, align_frequency, backend):
+        super(AverageWorker,self).__init__()
+        self.file_names = file_names
+        self.settings = settings
+        self.align_phase = align_phase
+        self.align_frequency = align_frequency
+        self.backend = backend
+        self.signals = AverageSignals()
+    @pyqtSlot()
+    def run(self):
+        try:
+            average = average_files(self.file_names, self.settings, self.align_phase, self.align_frequency,
+                                    self.backend, self.signals.progress.emit)
+        except Exception as e: # raised on a pool thread it would abort the gui
+            self.signals.error.emit(str(e))
+        else:
+            self.signals.result.emit(average)
+
+class FourierScheduler(QObject):
+    '''
+    runs FourierWorkers on a thread pool, the latest request wins
+
+    every request gets a generation number, queued jobs of older generations
+    are taken back from the pool or skip the fft when they start, results of
+    older generations are dropped, so only the newest spectrum reaches result
+    '''
+    result = pyqtSignal(tuple) # (freq_x, freq_y)
+    status = pyqtSignal(str)
+
+    def __init__(self, parent=None):
+        super(FourierScheduler, self).__init__(parent)
+        self.threadpool = QThreadPool()
+        self.generation = 0
+        self.jobs = {} # generation: (worker, submit time)
+        self.dropped = 0
+
+    def is_current(self, generation):
+        return generation == self.generation
+
+    def supersede(self):
+        '''
+        new generation, the jobs of older ones are taken back or dropped
+        '''
+        self.generation += 1
+        for generation, (worker, t) in list(self.jobs.items()):
+            try:
+                taken = self.threadpool.tryTake(worker) # only succeeds if not started yet
+            except RuntimeError: # already run and deleted by the pool
+                taken = False
+            if taken:
+                del self.jobs[generation]
+                self.dropped += 1
+
+    def submit(self, time_sig, f_max, backend, band=None):
+        self.supersede()
+        worker = FourierWorker(time_sig, f_max, backend, self.generation, self.is_current, band)
+        worker.signals.data.connect(self._data)
+        worker.signals.error.connect(self._error)
+        worker.signals.finished.connect(self._finished)
+        self.jobs[self.generation] = (worker, time.perf_counter())
+        self.threadpool.start(worker)
+        self.status.emit(f'Waiting... (queue {len(self.jobs)})')
+
+    def _data(self, data):
+        freq_x, freq_y, generation, fft_time = data
+        if generation != self.generation:
+            self.dropped += 1
+            return
+        latency = time.perf_counter() - self.jobs[generation][1]
+        self.result.emit((freq_x, freq_y))
+        self.status.emit('Ready (fft {:.1f} ms, latency {:.1f} ms, dropped {})'.format(
+                         fft_time*1e3, latency*1e3, self.dropped))
+
+    def _error(self, error):
+        generation, message = error
+        if generation == self.generation:
+            self.status.emit(f'FFT failed ({message})')
+
+    def _finished(self, generation):
+        self.jobs.pop(generation, None)
+        if self.jobs:
+            self.status.emit(f'Waiting... (queue {len(self.jobs)})')
 
 '''
 customized gui
@@ -61,6 +182,12 @@ customized gui
 class MyLineEdit(QLineEdit):
     '''
     edit class for capturing input
+
+    the signals of one edit (textChanged, editingFinished, returnPressed,
+    setText from the mouse tools) are coalesced, textModified is emitted once
+    the text settled for EDIT_DELAY, and only if its numbers differ from the
+    ones emitted last; return (also returnPressed.emit() for new data)
+    always emits
     '''
     textModified = pyqtSignal(str,str) # (key, text)
     def __init__(self, key, contents='', parent=None):
@@ -69,12 +196,32 @@ class MyLineEdit(QLineEdit):
         self.editingFinished.connect(self.checkText)
         self.textChanged.connect(lambda: self.checkText())
         self.returnPressed.connect(lambda: self.checkText(True))
-        self._before = contents
+        self._value = self.parse(contents) # numbers of the last emitted text
+        self._force = False
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(EDIT_DELAY)
+        self.timer.timeout.connect(self.emitText)
+
+    @staticmethod
+    def parse(text):
+        try:
+            return [float(x) for x in text.split(' ')]
+        except ValueError:
+            return None
 
     def checkText(self, _return=False):
         if (not self.hasFocus() or _return):
-            self._before = self.text()
-            self.textModified.emit(self.key, self.text())
+            self._force = self._force or _return
+            self.timer.start() # restarted by every further change
+
+    def emitText(self):
+        value = self.parse(self.text())
+        if value == self._value and value is not None and not self._force:
+            return # nothing to recompute
+        self._value = value
+        self._force = False
+        self.textModified.emit(self.key, self.text())
 
 class MyQAction(QAction):
     '''
@@ -96,10 +243,69 @@ main gui window intitation
 '''
 
 
+class ProfileDock(QDockWidget):
+    '''
+    latency histograms of the timing spans (nsor_profile) of every stage,
+    refreshed every PROFILE_FRAME while shown and new spans were recorded
+    '''
+    def __init__(self, parent=None):
+        super(ProfileDock, self).__init__('Timings', parent)
+        from matplotlib.backends.backend_qt5agg import FigureCanvas
+        from matplotlib.figure import Figure
+        self.canvas = FigureCanvas(Figure(figsize=(6, 12)))
+        self.canvas.setMinimumSize(400, 600)
+        self.setWidget(self.canvas)
+        self.axes = {} # made on the first refresh
+        self.count = None # profiler.count at the last refresh
+        self.timer = QTimer(self)
+        self.timer.setInterval(PROFILE_FRAME)
+        self.timer.timeout.connect(self.refresh)
+        self.visibilityChanged.connect(self._visibility_changed)
+
+    def _visibility_changed(self, visible):
+        if visible:
+            self.refresh()
+            self.timer.start()
+        else:
+            self.timer.stop()
+
+    def refresh(self, force=False):
+        if profiler.count == self.count and not force:
+            return
+        self.count = profiler.count
+        if not self.axes:
+            for i, name in enumerate(STAGES):
+                self.axes[name] = self.canvas.figure.add_subplot(len(STAGES), 1, i+1,
+                                                                 sharex=self.axes.get(STAGES[0]))
+            self.canvas.figure.subplots_adjust(left=0.1, right=0.97, top=0.96, bottom=0.08, hspace=0.8)
+        for name, ax in self.axes.items():
+            ax.clear()
+            ax.set_xscale('log')
+            ax.tick_params(labelsize='x-small', labelbottom=name == STAGES[-1])
+            summary = profiler.summary(name)
+            if summary is None:
+                ax.set_title(f'{name}: no spans', loc='left', fontsize='x-small')
+                continue
+            ax.hist(profiler.samples(name), bins=HISTOGRAM_BINS)
+            ax.set_title('{}: n {}, p50/90/99 {:.3g}/{:.3g}/{:.3g} ms'.format(name, *summary),
+                         loc='left', fontsize='x-small')
+        ax.set_xlabel('ms', fontsize='x-small')
+        self.canvas.figure.suptitle('' if profiler.enabled else 'not recording (Profile > Record Timings)',
+                                    fontsize='small')
+        self.canvas.draw()
+
+
 class MainWindow(QMainWindow):
     def __init__(self, *args, **kwargs):
         super(MainWindow,self).__init__()
 
+        # the figure stack is only imported when a window is made, not with the module
+        import matplotlib
+        from matplotlib.backends.backend_qt5agg import FigureCanvas
+        from matplotlib.figure import Figure
+        from nsor_render import DecimatedLine, RenderManager
+        screen_height = QApplication.desktop().screenGeometry().height()
+
         self.setWindowTitle('Data Analysis for NSOR project')
         self.setWindowIcon(QIcon(BASE_FOLDER + r'\pyqt_analysis\icons\window_icon.png'))
 
@@ -151,6 +357,56 @@ class MainWindow(QMainWindow):
         editParameters.setStatusTip('open and edit the parameter file')
         editParameters.triggered.connect(self.edit_parameters)
 
+        averageScans = QAction('&Average Scans...', self)
+        averageScans.setStatusTip('co-add repeated scans one file at a time and show the average')
+        averageScans.triggered.connect(self.average_scans)
+
+        self.alignPhase = QAction('Align &Phase', self)
+        self.alignPhase.setStatusTip('rotate every scan to the phase of the first one before averaging')
+        self.alignPhase.setCheckable(True)
+
+        self.alignFrequency = QAction('Align &Frequency', self)
+        self.alignFrequency.setStatusTip('shift every scan to the peak frequency (freq cursors) of the first one before averaging')
+        self.alignFrequency.setCheckable(True)
+
+        streamFile = QAction('Stream &File...', self)
+        streamFile.setStatusTip('follow a growing data file or named pipe as it is written')
+        streamFile.triggered.connect(self.stream_file)
+
+        streamSocket = QAction('Stream &Socket...', self)
+        streamSocket.setStatusTip('follow data sent to a tcp socket (host:port)')
+        streamSocket.triggered.connect(self.stream_socket)
+
+        stopStream = QAction('S&top Stream', self)
+        stopStream.setStatusTip('stop following the live data, the last data stays on screen')
+        stopStream.triggered.connect(self.stop_stream)
+
+        self.checkSampling = QAction('&Check Sampling', self)
+        self.checkSampling.setStatusTip('check that the time stamps of opened files are uniformly spaced')
+        self.checkSampling.setCheckable(True)
+
+        self.useSidecar = QAction('Use Sidecar &Cache', self)
+        self.useSidecar.setStatusTip('keep a native copy, the plot decimation and the last spectra of opened bin files in the user cache folder, '
+                                     'the first open copies the whole file, reopening it is immediate')
+        self.useSidecar.setCheckable(True)
+
+        self.recordTimings = QAction('&Record Timings', self)
+        self.recordTimings.setStatusTip('time the load, slice, pad, fft, phase, integral and render stages')
+        self.recordTimings.setCheckable(True)
+        self.recordTimings.toggled.connect(self.record_timings)
+
+        exportTrace = QAction('&Export Trace...', self)
+        exportTrace.setStatusTip('save the recorded timings as a chrome trace (chrome://tracing, ui.perfetto.dev)')
+        exportTrace.triggered.connect(self.export_trace)
+
+        clearTimings = QAction('&Clear Timings', self)
+        clearTimings.setStatusTip('forget the recorded timings')
+        clearTimings.triggered.connect(self.clear_timings)
+
+        self.fixedPhase = QAction('Save Fixed &Phase', self)
+        self.fixedPhase.setStatusTip('save the current 0th order phase for batch processing instead of auto phasing every file')
+        self.fixedPhase.setCheckable(True)
+
         saveParameters = QAction('&Save Parameter', self)
         saveParameters.setShortcut('Ctrl+S')
         saveParameters.setStatusTip('save the parameters on screen to file')
@@ -160,17 +416,49 @@ class MainWindow(QMainWindow):
         self.data_type.setStatusTip('bin for legacy data recorded from labview program, big endian coded binary data, npy for numpy type data')
         self.data_type.addItems(['bin', '.npy'])
 
+        self.fft_backend = FFTBackend()
+        self.fft_backend.load_wisdom(WISDOM_FILE)
+        self.backend_type = QComboBox()
+        self.backend_type.setStatusTip('fft library used for the spectrum, pyfftw and scipy use all cores')
+        self.backend_type.addItems(available_backends())
+        self.backend_type.activated[str].connect(self.set_fft_backend)
+
+        self.data_actions = [openFile, averageScans, streamFile, streamSocket] # disabled while scans are averaged
+        self.average_worker = None
+
         '''
         setting menubar
         '''
         mainMenu = self.menuBar() #create a menuBar
         fileMenu = mainMenu.addMenu('&File') #add a submenu to the menu bar
         fileMenu.addAction(openFile) # add what happens when this menu is interacted
+        fileMenu.addAction(self.checkSampling)
+        fileMenu.addAction(self.useSidecar)
+        fileMenu.addSeparator()
+        fileMenu.addAction(averageScans)
+        fileMenu.addAction(self.alignPhase)
+        fileMenu.addAction(self.alignFrequency)
+        fileMenu.addSeparator()
+        fileMenu.addAction(streamFile)
+        fileMenu.addAction(streamSocket)
+        fileMenu.addAction(stopStream)
         fileMenu.addSeparator()
         fileMenu.addAction(exitProgram) # add an exit menu
         parameterMenu = mainMenu.addMenu('&Parameter')
         parameterMenu.addAction(editParameters)
         parameterMenu.addAction(saveParameters)
+        parameterMenu.addAction(self.fixedPhase)
+        self.profile_dock = ProfileDock(self)
+        self.addDockWidget(Qt.RightDockWidgetArea, self.profile_dock)
+        self.profile_dock.hide()
+        showTimings = self.profile_dock.toggleViewAction()
+        showTimings.setText('&Show Timings')
+        showTimings.setStatusTip('latency histograms of the recorded stages')
+        profileMenu = mainMenu.addMenu('P&rofile')
+        profileMenu.addAction(self.recordTimings)
+        profileMenu.addAction(showTimings)
+        profileMenu.addAction(exportTrace)
+        profileMenu.addAction(clearTimings)
 
 
 
@@ -178,7 +466,7 @@ class MainWindow(QMainWindow):
         setting toolbar
         '''
         self.toolbar = self.addToolBar('nsor_toolbar') #add a tool bar to the window
-        if app.desktop().screenGeometry().height() == 2160:
+        if screen_height == 2160:
             self.toolbar.setIconSize(QSize(100,100))
         else:
             self.toolbar.setIconSize(QSize(60,60))
@@ -186,6 +474,7 @@ class MainWindow(QMainWindow):
 
 
         self.toolbar.addWidget(self.data_type)
+        self.toolbar.addWidget(self.backend_type)
         self.toolbar.addAction(renewData)
         self.toolbar.addSeparator()
 
@@ -201,11 +490,14 @@ class MainWindow(QMainWindow):
 
 
         self.statusBar() #create a status bar
+        self.cache_lb = QLabel('', self)
+        self.cache_lb.setStatusTip('spectra of earlier cursor windows and zerofillings are reused, least recently used ones are evicted')
+        self.statusBar().addPermanentWidget(self.cache_lb)
         '''
         setting matplotlib
         '''
 
-        if app.desktop().screenGeometry().height() == 2160:
+        if screen_height == 2160:
             matplotlib.rcParams.update({'font.size': 28})
         else:
             matplotlib.rcParams.update({'font.size': 14})
@@ -228,13 +520,19 @@ class MainWindow(QMainWindow):
         self.vline = {}
         self.ax['time'] = self.fig.add_subplot(121)
         self.ax['freq'] = self.fig.add_subplot(122)
+        self.render = RenderManager(self.canvas, self.ax) # all redraws of the figure go through it
+        self.lines = {} # persistent nsor_render.DecimatedLine of the time and freq traces
+        self.lines['time'] = DecimatedLine(self.ax['time'])
+        self.lines['freq'] = DecimatedLine(self.ax['freq'])
+        self.phase_line = DecimatedLine(self.ax['freq'], color='C0', visible=False) # phased spectrum, shown instead of lines['freq']
 
         for axis in self.ax.values():
-            if app.desktop().screenGeometry().height() == 2160:
+            if screen_height == 2160:
                 axis.tick_params(pad=20)
-            elif app.desktop().screenGeometry().height() == 1080:
+            elif screen_height == 1080:
                 axis.tick_params(pad=10)
             # axis.ticklabel_format(style='sci', axis='y', scilimits=(0,0))
+            axis.ticklabel_format(style='sci', axis='both', scilimits=(0,0)) # format the tick label of the axes
 
         self.fourier_lb = QLabel("Ready", self)
 
@@ -257,7 +555,7 @@ class MainWindow(QMainWindow):
         for key,value in self.parameters.items():
             if type(value) == list:
                 val = str(value[0])+' '+str(value[1])
-            if key =='file_name':
+            if key =='file_name' or key in PROCESSING_KEYS:
                 continue
             labels[key] = QLabel(key.replace('_',' ').title(),self)
             self.edits[key] = MyLineEdit(key, val, self)
@@ -268,8 +566,8 @@ class MainWindow(QMainWindow):
             if 'cursor' in key:
                 self.vline[key[0:4]+'_l'] = self.ax[key[0:4]].axvline(float(value[0]), c = 'red')
                 self.vline[key[0:4]+'_r'] = self.ax[key[0:4]].axvline(float(value[1]), c = 'red')
-                self.vline[key[0:4]+'_l'].set_animated(True)
-                self.vline[key[0:4]+'_r'].set_animated(True)
+                self.render.add_animated(key[0:4], self.vline[key[0:4]+'_l'])
+                self.render.add_animated(key[0:4], self.vline[key[0:4]+'_r'])
 
         self.integral_label = QLabel('Peak Intensity: \n0',self)
 
@@ -278,6 +576,27 @@ class MainWindow(QMainWindow):
         self.zeroPadPower.setStatusTip('This sets the zerofilling of the data')
         self.zeroPadPower.activated[str].connect(self.zero_padding)
 
+        self.zeroPadMode = QComboBox(self)
+        self.zeroPadMode.addItems(ZERO_FILL_MODES)
+        self.zeroPadMode.setStatusTip('zerofill to a power of 2 or to the nearest fast (2^a*3^b*5^c) length')
+        self.zeroPadMode.activated[str].connect(self.zero_fill_changed)
+
+        self.zeroPadResolution = QLineEdit(self)
+        self.zeroPadResolution.setPlaceholderText('Resolution (Hz)')
+        self.zeroPadResolution.setStatusTip('target frequency resolution, overrides the zerofilling factor when set')
+        self.zeroPadResolution.editingFinished.connect(self.zero_fill_changed)
+
+        self.windowType = QComboBox(self)
+        self.windowType.addItems(WINDOWS)
+        self.windowType.setStatusTip('apodization of the time cursor window before the fft, against sinc ringing of truncated fids')
+        self.windowType.activated[str].connect(self.zero_fill_changed)
+
+        self.windowParameter = QLineEdit(self)
+        self.windowParameter.setPlaceholderText('LB (Hz) / beta')
+        self.windowParameter.setStatusTip('line broadening (Hz) of the exponential and gaussian window, beta of the kaiser window, default if empty')
+        self.windowParameter.editingFinished.connect(self.zero_fill_changed)
+        self.apodizer = Apodizer() # fft input buffers, reused while the selection stays the same
+
         '''
         phase stuff
         '''
@@ -290,29 +609,54 @@ class MainWindow(QMainWindow):
         self.toolbar.addAction(first_order_phase_check)
 
         auto_phase_btn = QAction(QIcon(BASE_FOLDER + r'\pyqt_analysis\icons\auto_phase_btn.png'),'&Auto Phase',self)
-        auto_phase_btn.setStatusTip('Auto phase the peak (0th order only)')
+        auto_phase_btn.setStatusTip('Auto phase the peak (0th and 1st order when first order is on)')
         auto_phase_btn.setShortcut('Ctrl+A')
         auto_phase_btn.triggered.connect(self.auto_phase)
         self.toolbar.addAction(auto_phase_btn)
 
+        self.zoomFFT = QAction('&Zoom FFT', self)
+        self.zoomFFT.setStatusTip('compute the spectrum only inside the freq x limit (chirp-z), at the zerofilled point density')
+        self.zoomFFT.setCheckable(True)
+        self.zoomFFT.toggled.connect(self.zero_fill_changed)
+        self.toolbar.addAction(self.zoomFFT)
+        self.zoom_band = None # freq x limit of the current zoom spectrum
+
         self.zeroth_slider = QSlider(self)
         self.zeroth_slider.setMinimum(0)
         self.zeroth_slider.setMaximum(360)
         self.zeroth_slider.setValue(0)
         self.zeroth_slider.setTickInterval(1)
         self.zeroth_slider.valueChanged.connect(self.zeroth_order_phase)
+        self.zeroth_slider.sliderPressed.connect(self.slider_pressed)
         self.zeroth_slider.sliderReleased.connect(self.slider_released)
 
 
         self.first_slider = QSlider(self)
-        self.first_slider.setMinimum(0)
+        self.first_slider.setMinimum(-360)
         self.first_slider.setMaximum(360)
         self.first_slider.setValue(0)
         self.first_slider.hide()
         self.first_slider.valueChanged.connect(self.first_order_phase)
+        self.first_slider.sliderPressed.connect(self.slider_pressed)
+        self.first_slider.sliderReleased.connect(self.slider_released)
 
         self.phase_info = QLabel('Current Phase: \n0th: 0\n1st: 0 \nInt: 0',self)
 
+        self.phase = PhaseCorrector() # keeps the phase buffers of the current spectrum
+        self.integral = WindowIntegral() # prefix sums of the current spectrum for the cursor integrals
+        self.first_order_on = False
+        self.pending_phase = [0, 0] # (0th, 1st) in rad, applied by phase_redraw
+        self.phase_dragging = False # phase_line is animated while a slider is dragged
+        self.phase_timer = QTimer(self)
+        self.phase_timer.setSingleShot(True)
+        self.phase_timer.setInterval(PHASE_FRAME)
+        self.phase_timer.timeout.connect(self.phase_redraw)
+
+        self.stream = None # nsor_stream.StreamSource of the live data
+        self.stream_timer = QTimer(self)
+        self.stream_timer.setInterval(STREAM_FRAME)
+        self.stream_timer.timeout.connect(self.stream_update)
+
 
 
         '''
@@ -341,7 +685,19 @@ class MainWindow(QMainWindow):
         layout5.addWidget(self.first_slider)
 
 
+        for key, widget in (('zero_fill', self.zeroPadPower), ('zero_fill_mode', self.zeroPadMode), ('window', self.windowType), ('data_type', self.data_type)):
+            if widget.findText(str(self.parameters.get(key, ''))) >= 0: # numbers are accepted in the parameter file too
+                widget.setCurrentIndex(widget.findText(str(self.parameters[key])))
+        for key, widget in (('resolution', self.zeroPadResolution), ('window_parameter', self.windowParameter)):
+            value = self.parameters.get(key)
+            widget.setText('' if value is None else str(value))
+        self.fixedPhase.setChecked(str(self.parameters.get('phase', 'auto')) != 'auto')
+
         layout2.addWidget(self.zeroPadPower)
+        layout2.addWidget(self.zeroPadMode)
+        layout2.addWidget(self.zeroPadResolution)
+        layout2.addWidget(self.windowType)
+        layout2.addWidget(self.windowParameter)
         layout1.addLayout(layout2)
         layout2.addStretch(1)
         layout1.addLayout(layout3)
@@ -350,21 +706,45 @@ class MainWindow(QMainWindow):
         layout1.addLayout(layout4)
         # layout4.addStretch(1)
 
-        self.threadpool = QThreadPool() #Multithreading
+        self.fourier = FourierScheduler(self) #Multithreading
+        self.fourier.result.connect(self.set_fourier)
+        self.fourier.status.connect(self.fourier_lb.setText)
+        self.spectrum_cache = SpectrumCache()
+        self.sidecar = SidecarCache() # on disk in the user cache folder, per opened file
+        self.pending_key = None # cache key of the spectrum being computed
 
     '''
     ################################################################################
     phase
     '''
+    def slider_pressed(self):
+        '''
+        while a phase slider is dragged, only the phased line is redrawn and
+        blitted on top of a cached background of the freq axes; a new
+        spectrum hides the phased line, it is shown again first
+        '''
+        if not self.phase_line.line.get_visible():
+            try:
+                self.apply_phase(self.zeroth_slider.value()/360*2*pi, self.first_slider.value()/360*2*pi)
+                self.draw_phased_data()
+            except (AttributeError, KeyError): # no spectrum yet
+                return
+        if self.phase_line.line.get_visible():
+            self.render.add_animated('freq', self.phase_line.line)
+            self.render.invalidate('freq') # background without the line
+            self.phase_dragging = True
+
     def slider_released(self):
-        self.canvas.draw()
-        key = 'freq'
-        self.ax[key[0:4]].ticklabel_format(style='sci', axis='both', scilimits=(0,0)) # format the tick label of the axes
-        for k in self.ax.keys():
-            self.ax[k].draw_artist(self.vline[k+'_l'])
-            self.ax[k].draw_artist(self.vline[k+'_r'])
+        if self.phase_timer.isActive():
+            self.phase_timer.stop()
+            self.phase_redraw()
+        if self.phase_dragging:
+            self.render.remove_animated('freq', self.phase_line.line)
+            self.phase_dragging = False
+        self.render.invalidate('freq')
 
     def first_order_phase_check(self,toggle_state):
+        self.first_order_on = toggle_state
         if toggle_state:
             self.first_slider.show()
         else:
@@ -373,17 +753,27 @@ class MainWindow(QMainWindow):
 
     def auto_phase(self):
         try:
-            reft = self.data['freq_y'].real[self.csL:self.csR]
-            imft = self.data['freq_y'].imag[self.csL:self.csR]
-            intensity_int = np.array([])
-            for angle in range(360):
-                phi = angle/360*2*pi
-                intensity_int = np.append(intensity_int, np.sum(np.cos(phi)*reft + np.sin(phi)*imft))
-            best_angle = intensity_int.argmax()
-            best_phi = best_angle/360*2*pi
-            self.zeroth_slider.setValue(best_angle)
-            self.data['freq_real'] = self.data['freq_y'].real*np.cos(best_phi) + \
-                                     self.data['freq_y'].imag*np.sin(best_phi)
+            first_order = self.first_order_on
+            if first_order: # 2-D (ph0, ph1) search of the visible band, within the slider range
+                limit = [float(x) for x in self.edits['freq_x_limit'].text().split(' ')]
+                band = index_range(self.data['freq_x'], min(limit), max(limit))
+                if band[1] - band[0] < self.csR - self.csL:
+                    band = (self.csL, self.csR)
+                best_phi, best_phi1 = auto_phase_entropy(self.data['freq_y'], self.csL, self.csR, ph1_grid=PHASE1_GRID,
+                                                         pivot=(self.csL+self.csR)/2, band=band)
+                if abs(best_phi1) >= PHASE1_GRID[-1]: # on the edge of the grid, the optimum is out of the slider range
+                    first_order = False
+                    self.statusBar().showMessage('1st order phase out of the slider range, 0th order only')
+                elif abs(best_phi1)*(band[1] - band[0])/len(self.data['freq_y']) < PHASE1_MIN_TURN:
+                    first_order = False # hardly turns the visible band, not determined by its lines
+            if not first_order:
+                best_phi = auto_phase_zeroth(self.data['freq_y'], self.csL, self.csR) # closed form, not limited to whole degrees
+                best_phi1 = 0
+            for slider, phi in ((self.zeroth_slider, best_phi), (self.first_slider, best_phi1)):
+                slider.blockSignals(True) # the sliders only hold whole degrees, do not rephase with the rounded value
+                slider.setValue(int(round(phi/(2*pi)*360)))
+                slider.blockSignals(False)
+            self.apply_phase(best_phi, best_phi1)
             self.draw_phased_data()
         except AttributeError:
             dlg = QMessageBox.warning(self,'WARNING', 'No original data available!',
@@ -391,35 +781,54 @@ class MainWindow(QMainWindow):
 
 
     def zeroth_order_phase(self, value):
-        phi = value/360*2*pi
+        self.pending_phase[0] = value/360*2*pi
+        if not self.phase_timer.isActive():
+            self.phase_timer.start()
+
+
+    def first_order_phase(self, value):
+        self.pending_phase[1] = value/360*2*pi
+        if not self.phase_timer.isActive():
+            self.phase_timer.start()
+
+    def phase_redraw(self):
+        '''
+        apply the latest slider phases, called at most once per PHASE_FRAME
+        '''
         try:
-            reft = self.data['freq_y'].real[self.csL:self.csR]
-            imft = self.data['freq_y'].imag[self.csL:self.csR]
-            self.data['freq_real'] = self.data['freq_y'].real*np.cos(phi) + \
-                                     self.data['freq_y'].imag*np.sin(phi)
-            intensity = np.sum(np.cos(phi)*reft + np.sin(phi)*imft)
-            str = self.phase_info.text()
-            str_lst = str.split('\n')
-            intensity_str = "{:.5f}".format(intensity*2)
-            self.phase_info.setText(f'Current Phase: \n0th: {value}\n'+str_lst[2]+f'\nInt: {intensity_str}')
-            self.draw_phased_data()
-            self.canvas.blit(self.ax['freq'].bbox)
+            self.apply_phase(*self.pending_phase)
         except AttributeError:
             dlg = QMessageBox.warning(self,'WARNING', 'No original data available!',
                                         QMessageBox.Ok)
+            return
+        if self.phase_dragging:
+            self.phase_line.set_ydata(self.data['freq_real']) # only the visible range, per pixel min/max
+            self.render.update('freq')
+        else:
+            self.draw_phased_data()
 
-
-    def first_order_phase(self, value):
-        intensity = 0
-        str = self.phase_info.text()
-        str_lst = str.split('\n')
+    def apply_phase(self, phi0, phi1):
+        '''
+        phase freq_y with 0th and 1st order phase (rad), the 1st order phase
+        turns around the centre of the frequency cursors
+        self.data['freq_real'] is the phase buffer, updated in place
+        '''
+        self.pending_phase = [phi0, phi1]
+        with span('phase'):
+            self.data['freq_real'] = self.phase.apply(phi0, phi1, (self.csL+self.csR)/2)
+        with span('integral'):
+            if phi1 == 0:
+                intensity = self.integral.phased(self.csL, self.csR, phi0)
+            else:
+                intensity = np.sum(self.data['freq_real'][self.csL:self.csR])
         intensity_str = "{:.5f}".format(intensity*2)
-        self.phase_info.setText('Current Phase: \n'+ str_lst[1] +f'\n1st: {value}'+f'\nInt: {intensity_str}')
+        self.phase_info.setText('Current Phase: \n0th: {:.2f}\n1st: {:.2f}'.format(phi0/(2*pi)*360, phi1/(2*pi)*360)+f'\nInt: {intensity_str}')
 
     def draw_phased_data(self):
         key = 'freq'
-        self.ax[key].clear()
-        self.ax[key].plot(self.data[key+'_x'],self.data[key+'_real'])
+        self.lines[key].line.set_visible(False)
+        self.phase_line.line.set_visible(True)
+        self.phase_line.set_data(self.data[key+'_x'], self.data[key+'_real'], live=True)
 
         cs_value = [float(x) for x in self.edits[key+'_cursor'].text().split(' ')]
         self.vline[key+'_l'].set_xdata([cs_value[0], cs_value[0]])
@@ -427,14 +836,9 @@ class MainWindow(QMainWindow):
 
         lm_value = [float(x) for x in self.edits[key+'_x_limit'].text().split(' ')]
 
+        self.render.autoscale(key, self.phase_line.line)
         self.ax[key].set_xlim(lm_value[0],lm_value[1])
 
-        self.canvas.draw()
-        self.ax[key].ticklabel_format(style='sci', axis='both', scilimits=(0,0)) # format the tick label of the axes
-        for k in self.ax.keys():
-            self.ax[k].draw_artist(self.vline[k+'_l'])
-            self.ax[k].draw_artist(self.vline[k+'_r'])
-
 
 
 
@@ -450,10 +854,20 @@ class MainWindow(QMainWindow):
 
     def save_parameters(self):
         for key in self.parameters.keys():
-            if key =='file_name':
+            if key =='file_name' or key in PROCESSING_KEYS:
                 continue
             str = self.edits[key].text()
             self.parameters[key] = str.split(' ')
+        self.parameters['zero_fill'] = self.zeroPadPower.currentText()
+        self.parameters['zero_fill_mode'] = self.zeroPadMode.currentText()
+        self.parameters['resolution'] = self.zeroPadResolution.text().strip()
+        self.parameters['window'] = self.windowType.currentText()
+        self.parameters['window_parameter'] = self.windowParameter.text().strip()
+        if self.fixedPhase.isChecked():
+            self.parameters['phase'] = "{:.2f}".format(self.phase.ph0/(2*pi)*360)
+        else:
+            self.parameters['phase'] = 'auto' # the batch pipeline phases every file itself
+        self.parameters['data_type'] = self.data_type.currentText()
 
         save_parameter(PARAMETER_FILE, **self.parameters)
 
@@ -470,12 +884,7 @@ class MainWindow(QMainWindow):
             except AttributeError:
                 self.ax[key[0:4]].autoscale(axis = key[5])
 
-
-        self.canvas.draw()
-        self.ax[key[0:4]].ticklabel_format(style='sci', axis='both', scilimits=(0,0)) # format the tick label of the axes
-        for k in self.ax.keys():
-            self.ax[k].draw_artist(self.vline[k+'_l'])
-            self.ax[k].draw_artist(self.vline[k+'_r'])
+        self.render.invalidate(key[0:4])
 
     '''
     ################################################################################
@@ -492,44 +901,42 @@ class MainWindow(QMainWindow):
             if 'limit' in key:
                 if 'x' in key:
                     self.ax[key[0:4]].set_xlim(value[0],value[1])
+                    if key == 'freq_x_limit' and self.zoomFFT.isChecked() and value != self.zoom_band:
+                        self.zero_padding(self.zeroPadPower.currentText()) # the zoom spectrum only covers the limits
                 elif 'y' in key:
                     self.ax[key[0:4]].set_ylim(value[0],value[1])
-
+                self.render.invalidate(key[0:4])
 
             elif 'cursor' in key:
                 self.vline[key[0:4]+'_l'].set_xdata([value[0], value[0]])
                 self.vline[key[0:4]+'_r'].set_xdata([value[1], value[1]])
+                self.render.update(key[0:4]) # only the cursors move
                 try:
-                    cs1 = np.argmin(np.abs(self.data[key[0:4]+'_x']-value[0])) # finding the index corresponding to the time stamp
-                    cs2 = np.argmin(np.abs(self.data[key[0:4]+'_x']-value[1]))
-                    if cs1>cs2:
-                        self.cursor_operation(key, cs2, cs1)
-                    else:
-                        self.cursor_operation(key, cs1, cs2)
+                    with span('slice'):
+                        csL, csR = index_range(self.data[key[0:4]+'_x'], value[0], value[1]) # finding the index corresponding to the time stamp
+                    self.cursor_operation(key, csL, csR)
                 except AttributeError:
                     dlg = QMessageBox.warning(self,'WARNING', 'No original data available!',
                                                 QMessageBox.Ok)
 
 
-            self.canvas.draw()
-            self.ax[key[0:4]].ticklabel_format(style='sci', axis='both', scilimits=(0,0)) # format the tick label of the axes
-            for k in self.ax.keys():
-                self.ax[k].draw_artist(self.vline[k+'_l'])
-                self.ax[k].draw_artist(self.vline[k+'_r'])
-
-
         except ValueError:
             dlg = QMessageBox.warning(self,'WARNING', 'Input only number',
                                         QMessageBox.Ok)
 
 
     def cursor_operation(self, key, csL, csR):
-        self.csL = csL
-        self.csR = csR
+        '''
+        self.csL, self.csR are the indices of the freq cursors, used by the
+        phase and integral, the time cursors only go to the fft
+        '''
         if 'time' in key:
             self.zero_padding(self.zeroPadPower.currentText(),[csL,csR])
         elif 'freq' in key:
-            intensity = ( np.sum(self.data['freq_y'].real)**2 + np.sum(self.data['freq_y'].imag)**2 )**(1/2)
+            self.csL = csL
+            self.csR = csR
+            with span('integral'):
+                intensity = self.integral.magnitude(csL, csR) # |sum of freq_y[csL:csR]| from the prefix sums
             intensity_str = "{:.5f}".format(intensity)
             self.integral_label.setText(f'Peak Intensity: \n{intensity_str}') #
 
@@ -552,13 +959,7 @@ class MainWindow(QMainWindow):
                         self.c_lock = True
                         self.x0 = event.xdata
                         self.current_line.set_xdata([event.xdata,event.xdata])
-                        line1,line2 = self.cursor_lines_in_axis(ax)
-
-                        self.canvas.draw()
-                        self.background = self.canvas.copy_from_bbox(ax.bbox)
-                        ax.draw_artist(line1)
-                        ax.draw_artist(line2)
-                        self.canvas.blit(ax.bbox)
+                        self.render.update(self.render.key(ax))
 
 
         def on_motion(event):
@@ -568,10 +969,7 @@ class MainWindow(QMainWindow):
 
                 if self.c_lock:
                     self.current_line.set_xdata([event.xdata,event.xdata])
-                    self.canvas.restore_region(self.background)
-                    ax.draw_artist(line1)
-                    ax.draw_artist(line2)
-                    self.canvas.blit(ax.bbox)
+                    self.render.update(self.render.key(self.last_ax))
                     if self.x0 > event.xdata:
                         self.c_side = 'left'
                     else:
@@ -597,7 +995,6 @@ class MainWindow(QMainWindow):
 
         def on_release(event):
             if self.c_lock:
-                self.background = None
                 self.c_lock = False
 
                 ax = event.inaxes
@@ -676,37 +1073,18 @@ class MainWindow(QMainWindow):
                         self.btm_ln.set_color('m')
                         self.vzoom_ln.set_color('m')
                         # print(self.right_ln.get_xdata(), self.right_ln.get_ydata())
-                        self.btm_ln.set_animated(True)
-                        self.vzoom_ln.set_animated(True)
-                        self.canvas.draw()
-                        self.background = self.canvas.copy_from_bbox(ax.bbox)
-                        ax.draw_artist(self.vzoom_ln)
-                        ax.draw_artist(self.btm_ln)
-                        line1,line2 = self.cursor_lines_in_axis(ax)
-                        ax.draw_artist(line1)
-                        ax.draw_artist(line2)
-                        self.canvas.blit(ax.bbox)
+                        self.render.add_animated(self.render.key(ax), self.btm_ln)
+                        self.render.add_animated(self.render.key(ax), self.vzoom_ln)
+                        self.render.invalidate(self.render.key(ax)) # background with top_ln
                     else:
-
-                        self.top_ln.remove()
-                        self.vzoom_ln.remove()
-                        self.btm_ln.remove()
-                        self.canvas.draw()
-                        self.background = None
+                        self.remove_zoom_lines(self.top_ln, self.vzoom_ln, self.btm_ln)
                         self.vlock = False
-                        ax.draw_artist(line1)
-                        ax.draw_artist(line2)
-                        self.canvas.blit(ax.bbox)
                 except:
                     print('no')
         def on_release(event):
             if self.vlock:
                 try:
-                    self.top_ln.remove()
-                    self.vzoom_ln.remove()
-                    self.btm_ln.remove()
-                    self.canvas.draw()
-                    self.background = None
+                    self.remove_zoom_lines(self.top_ln, self.vzoom_ln, self.btm_ln)
                     self.vlock = False
                     ax = event.inaxes
                     if ax != self.last_ax:
@@ -734,13 +1112,7 @@ class MainWindow(QMainWindow):
                 if ax != None:
                     self.btm_ln.set_ydata([event.ydata, event.ydata])
                     self.vzoom_ln.set_ydata([self.y0, event.ydata])
-                    self.canvas.restore_region(self.background)
-                    ax.draw_artist(self.vzoom_ln)
-                    ax.draw_artist(self.btm_ln)
-                    line1,line2 = self.cursor_lines_in_axis(ax)
-                    ax.draw_artist(line1)
-                    ax.draw_artist(line2)
-                    self.canvas.blit(ax.bbox)
+                    self.render.update(self.render.key(self.last_ax))
                     if self.y0 > event.ydata:
                         self.vside = 'btm'
                     else:
@@ -770,6 +1142,16 @@ class MainWindow(QMainWindow):
 
 
 
+    def remove_zoom_lines(self, *lines):
+        '''
+        remove the marker lines of a vertical or horizontal zoom
+        '''
+        key = self.render.key(self.last_ax)
+        for line in lines:
+            self.render.remove_animated(key, line)
+            line.remove()
+        self.render.invalidate(key)
+
     def hzoom(self, state):
         def on_press(event):
             if self.in_ax:
@@ -791,26 +1173,13 @@ class MainWindow(QMainWindow):
                         self.right_ln.set_color('m')
                         self.hzoom_ln.set_color('m')
                         # print(self.right_ln.get_xdata(), self.right_ln.get_ydata())
-                        self.right_ln.set_animated(True)
-                        self.hzoom_ln.set_animated(True)
-                        self.canvas.draw()
-                        self.background = self.canvas.copy_from_bbox(ax.bbox)
-                        ax.draw_artist(self.hzoom_ln)
-                        ax.draw_artist(self.right_ln)
-                        ax.draw_artist(line1)
-                        ax.draw_artist(line2)
-                        self.canvas.blit(ax.bbox)
+                        self.render.add_animated(self.render.key(ax), self.right_ln)
+                        self.render.add_animated(self.render.key(ax), self.hzoom_ln)
+                        self.render.invalidate(self.render.key(ax)) # background with left_ln
 
                     else:
-                        self.left_ln.remove()
-                        self.hzoom_ln.remove()
-                        self.right_ln.remove()
-                        self.canvas.draw()
-                        self.background = None
+                        self.remove_zoom_lines(self.left_ln, self.hzoom_ln, self.right_ln)
                         self.hlock = False
-                        ax.draw_artist(line1)
-                        ax.draw_artist(line2)
-                        self.canvas.blit(ax.bbox)
 
                 except:
                     print('no')
@@ -821,13 +1190,7 @@ class MainWindow(QMainWindow):
                 if ax != None:
                     self.right_ln.set_xdata([event.xdata, event.xdata])
                     self.hzoom_ln.set_xdata([self.x0, event.xdata])
-                    self.canvas.restore_region(self.background)
-                    ax.draw_artist(self.hzoom_ln)
-                    ax.draw_artist(self.right_ln)
-                    line1,line2 = self.cursor_lines_in_axis(ax)
-                    ax.draw_artist(line1)
-                    ax.draw_artist(line2)
-                    self.canvas.blit(ax.bbox)
+                    self.render.update(self.render.key(self.last_ax))
                     if self.x0 > event.xdata:
                         self.hside = 'left'
                     else:
@@ -838,11 +1201,7 @@ class MainWindow(QMainWindow):
         def on_release(event):
             if self.hlock:
                 try:
-                    self.left_ln.remove()
-                    self.hzoom_ln.remove()
-                    self.right_ln.remove()
-                    self.canvas.draw()
-                    self.background = None
+                    self.remove_zoom_lines(self.left_ln, self.hzoom_ln, self.right_ln)
                     self.hlock = False
                     ax = event.inaxes
                     if ax != self.last_ax:
@@ -897,25 +1256,27 @@ class MainWindow(QMainWindow):
     ################################################################################
     Multithreading fft calculation
     '''
-    def fourier_multithreading(self, time_sig):
-        self.fourier_lb.setText('Waiting...')
-        fourier_worker = FourierWorker(time_sig, self.f_max)
-        fourier_worker.signals.data.connect(self.set_fourier)
-        fourier_worker.signals.finished.connect(self.fourier_finished)
-        self.threadpool.start(fourier_worker)
+    def fourier_multithreading(self, time_sig, band=None):
+        self.fourier.submit(time_sig, self.f_max, self.fft_backend, band)
 
     def set_fourier(self,data):
+        if self.pending_key is not None:
+            self.spectrum_cache.put(self.pending_key, data[0], data[1])
+            self.pending_key = None
         self.data['freq_x'] = data[0]
         self.data['freq_y'] = data[1]
+        with span('phase'):
+            self.phase.set_spectrum(data[1])
+        with span('integral'):
+            self.integral.set_spectrum(data[1])
+        # the freq cursor indices belong to the new grid right away, phase and
+        # integral must not use the old ones until the debounced edit fires
+        value = [float(x) for x in self.edits['freq_cursor'].text().split(' ')]
+        self.cursor_operation('freq_cursor', *index_range(data[0], value[0], value[1]))
         self.draw('freq')
         self.edits['freq_x_limit'].returnPressed.emit()
         self.edits['freq_cursor'].returnPressed.emit()
 
-
-
-    def fourier_finished(self):
-        self.fourier_lb.setText('Ready')
-
     '''
     ################################################################################
     make zerofilling work
@@ -923,25 +1284,71 @@ class MainWindow(QMainWindow):
 
 
     def zero_padding(self, pad_power, value = []):
-        if value == []:
-            value = [float(val) for val in self.parameters['time_cursor']]
-            cs1 = np.argmin(np.abs(self.data['time_x']-value[0])) # finding the index corresponding to the time stamp
-            cs2 = np.argmin(np.abs(self.data['time_x']-value[1]))
-        else:
-            cs1 = value[0]
-            cs2 = value[1]
+        '''
+        zerofill the time cursor window and start the fft, the length is
+        planned from the window (not the whole trace) by zero_fill_length
+        '''
         try:
-            time_data =self.data['time_y'][cs1:cs2]
-            pad_power = int(pad_power[1:])
-            x = np.ceil(np.log2(len(self.data['time_y'])))
-            n = 2**(pad_power-1)
-            l = int(2**x*n)
-            time_sig = np.pad(time_data,(0,l-len(time_data)),'constant')
-            self.fourier_multithreading(time_sig)
+            if value == []:
+                value = [float(val) for val in self.edits['time_cursor'].text().split(' ')]
+                with span('slice'):
+                    cs1, cs2 = index_range(self.data['time_x'], value[0], value[1]) # finding the index corresponding to the time stamp
+            else:
+                cs1 = value[0]
+                cs2 = value[1]
+            resolution = self.zeroPadResolution.text().strip()
+            l = zero_fill_length(cs2-cs1, int(pad_power[1:]), self.zeroPadMode.currentText(),
+                                 float(resolution) if resolution else None, 1/(2*self.f_max))
+            band = None
+            if self.zoomFFT.isChecked():
+                # same point spacing as the zerofilled fft, but only inside the freq x limit
+                limit = [float(x) for x in self.edits['freq_x_limit'].text().split(' ')]
+                df = float(resolution) if resolution else 2*self.f_max/l
+                if df <= 0:
+                    raise ValueError('resolution must be positive')
+                self.zoom_band = limit
+                f_start, f_stop = min(limit[:2]), max(limit[:2])
+                band = (f_start, f_stop, min(int((f_stop-f_start)/df)+1, ZOOM_POINTS)) # a coarser spacing beyond ZOOM_POINTS
+            window = self.windowType.currentText()
+            parameter = self.windowParameter.text().strip()
+            parameter = float(parameter) if parameter and window != 'none' else None
+            key = self.spectrum_key(cs1, cs2, l, band, (window, parameter))
+            if key is not None:
+                spectrum = self.spectrum_cache.get(key)
+                self.cache_lb.setText(self.spectrum_cache.status())
+                if spectrum is not None:
+                    self.fourier.supersede() # an fft still running for another window must not replace it
+                    self.pending_key = None
+                    self.set_fourier(spectrum)
+                    return
+            self.pending_key = key
+            # only the cursor window is copied out of the file, then apodized and zerofilled in place
+            source = key[0] if key is not None else None
+            with span('pad'):
+                time_sig = self.apodizer(self.data['time_y'], cs1, cs2, l if band is None else None,
+                                         window, parameter, 1/(2*self.f_max), source)
+            self.fourier_multithreading(time_sig, band)
         except AttributeError:
             dlg = QMessageBox.warning(self,'WARNING', 'No original data available!',
                                         QMessageBox.Ok)
             self.zeroPadPower.setCurrentIndex(0)
+        except ValueError:
+            dlg = QMessageBox.warning(self,'WARNING', 'Input only number',
+                                        QMessageBox.Ok)
+
+    def spectrum_key(self, cs1, cs2, l, band=None, window=None):
+        '''
+        key of the spectrum of time window cs1:cs2 zerofilled to l (or the
+        zoom band) with window (name, parameter) in self.spectrum_cache, None
+        for data that is not an unchanged file (averages, live streams)
+        '''
+        acquisition = getattr(self, 'acquisition', None)
+        if acquisition is None or self.data['time_y'] is not acquisition.y:
+            return None
+        return (acquisition.identity, cs1, cs2, l, band, window)
+
+    def zero_fill_changed(self):
+        self.zero_padding(self.zeroPadPower.currentText())
 
     '''
     ################################################################################
@@ -960,21 +1367,51 @@ class MainWindow(QMainWindow):
 
 
 
+    def record_timings(self, state):
+        profiler.enabled = state
+        self.profile_dock.refresh(force=True)
+
+    def export_trace(self):
+        file_name, _ = QFileDialog.getSaveFileName(self, 'Export Trace', 'nsor_trace.json', 'Chrome trace (*.json)')
+        if file_name:
+            profiler.export(file_name)
+
+    def clear_timings(self):
+        profiler.clear()
+
+    def set_fft_backend(self, name):
+        self.fft_backend = FFTBackend(name)
+        self.fft_backend.load_wisdom(WISDOM_FILE)
+
     def exit_program(self):
         choice = QMessageBox.question(self, 'Exiting',
                                                 'Are you sure about exit?',
                                                 QMessageBox.Yes | QMessageBox.No) #Set a QMessageBox when called
         if choice == QMessageBox.Yes:  # give actions when answered the question
-            sys.exit()
+            self.close()
+
+    def closeEvent(self, event):
+        '''
+        the window is closed by exit_program or by its title bar, the fftw
+        wisdom and the sidecar spectra are saved either way
+        '''
+        self.fft_backend.save_wisdom(WISDOM_FILE)
+        self.stop_stream()
+        self.save_sidecar()
+        event.accept()
 
 
 
     def open_file(self):
         '''
         open file and assign data to a dictionary self.Data
+        the file is memory mapped (self.acquisition), nothing is read
+        until a window of it is used
         self.data['raw_x']
         self.data['raw_y']
-        above two are the original data
+        above two are the original data, the x axes are UniformAxis
+        objects (t0, dt, n) instead of stored arrays unless the sampling
+        check finds the file non uniform
         self.data['time_x']
         self.data['time_y']
         self.data['freq_x']
@@ -984,25 +1421,176 @@ class MainWindow(QMainWindow):
         dlg = QFileDialog()
         dlg.setDirectory(read_parameter(PARAMETER_FILE)['file_name'])
         if dlg.exec_():
+            self.stop_stream()
+            self.save_sidecar()
             file_name = dlg.selectedFiles()[0]
             save_parameter(PARAMETER_FILE,
                         **{"file_name": file_name})
-            if str(self.data_type.currentText()) =='bin':
-                raw_data = np.fromfile(file_name, '>f8')
-            elif str(self.data_type.currentText()) == '.npy':
-                raw_data = np.load(file_name)
+            with span('load'):
+                if self.useSidecar.isChecked() and self.data_type.currentText() == 'bin':
+                    self.acquisition = self.sidecar.open(file_name)
+                else:
+                    self.acquisition = AcquisitionFile(file_name, str(self.data_type.currentText()))
+                uniform = not self.checkSampling.isChecked() or self.acquisition.is_uniform()
+            if isinstance(self.acquisition, CachedAcquisition):
+                for key, spectrum in self.acquisition.spectra():
+                    self.spectrum_cache.put((self.acquisition.identity,) + key, *spectrum)
             self.data = {}
-            self.data['raw_x'] = raw_data[::2]
-            self.data['raw_y'] = raw_data[1::2]
+            self.data['raw_x'] = self.acquisition.time_axis
+            if not uniform:
+                dlg = QMessageBox.warning(self,'WARNING', 'Time stamps are not uniformly spaced, using the stored time axis!',
+                                            QMessageBox.Ok)
+                self.data['raw_x'] = self.acquisition.x # cursor lookups fall back to binary search
+            self.data['raw_y'] = self.acquisition.y
             self.data['time_x'] = self.data['raw_x']
             self.data['time_y'] = self.data['raw_y']
-            dt = self.data['time_x'][1]-self.data['time_x'][0]
-            self.f_max =1/(2*dt)
-            self.fourier_multithreading(self.data['time_y'])
-            self.edits['time_cursor'].returnPressed.emit()
+            self.f_max = self.acquisition.f_max
+            self.edits['time_cursor'].returnPressed.emit() # fft of the cursor window
 
             self.draw('time')
 
+    def save_sidecar(self):
+        '''
+        store the last used spectra of the current file in its sidecar entry
+        before another file, an average or a stream replaces it
+        '''
+        acquisition = getattr(self, 'acquisition', None)
+        if isinstance(acquisition, CachedAcquisition):
+            acquisition.save_spectra([(key[1:], spectrum) for key, spectrum in self.spectrum_cache.items()
+                                      if key[0] == acquisition.identity])
+
+    def average_scans(self):
+        '''
+        average the selected scans into self.data['raw_y'], only the running
+        sum and the scan being added are in memory, the snr of the average is
+        shown after every scan; the scans are averaged on a pool thread, the
+        actions that replace the data are disabled until set_average
+        '''
+        dlg = QFileDialog()
+        dlg.setDirectory(read_parameter(PARAMETER_FILE)['file_name'])
+        dlg.setFileMode(QFileDialog.ExistingFiles)
+        if dlg.exec_():
+            self.stop_stream()
+            self.save_sidecar()
+            file_names = dlg.selectedFiles()
+            settings = read_settings(None, data_type=str(self.data_type.currentText()),
+                                     zero_fill=self.zeroPadPower.currentText(),
+                                     zero_fill_mode=self.zeroPadMode.currentText(),
+                                     resolution=self.zeroPadResolution.text().strip(),
+                                     window=self.windowType.currentText(),
+                                     window_parameter=self.windowParameter.text().strip(),
+                                     **{key: self.edits[key].text().split(' ') for key in ['time_cursor', 'freq_cursor', 'freq_x_limit']})
+            self.average_worker = AverageWorker(file_names, settings, self.alignPhase.isChecked(),
+                                                self.alignFrequency.isChecked(), self.fft_backend)
+            self.average_worker.signals.progress.connect(
+                lambda count, snr: self.fourier_lb.setText('averaged {}/{} scans, snr {:.1f}'.format(count, len(file_names), snr)))
+            self.average_worker.signals.result.connect(self.set_average)
+            self.average_worker.signals.error.connect(self.average_failed)
+            for action in self.data_actions:
+                action.setEnabled(False)
+            QThreadPool.globalInstance().start(self.average_worker)
+
+    def average_finished(self):
+        self.average_worker = None
+        for action in self.data_actions:
+            action.setEnabled(True)
+
+    def average_failed(self, message):
+        self.average_finished()
+        dlg = QMessageBox.warning(self,'WARNING', 'Scans could not be averaged!\n' + message,
+                                    QMessageBox.Ok)
+
+    def set_average(self, average):
+        self.average_finished()
+        self.acquisition = None
+        self.data = {}
+        self.data['raw_x'] = average.time_axis
+        self.data['raw_y'] = average.mean()
+        self.data['time_x'] = self.data['raw_x']
+        self.data['time_y'] = self.data['raw_y']
+        self.f_max = average.f_max
+        self.edits['time_cursor'].returnPressed.emit()
+
+        self.draw('time')
+        self.statusBar().showMessage('averaged {} scans, snr {:.1f} -> {:.1f}'.format(average.count, average.snr[0], average.snr[-1]))
+
+    '''
+    ################################################################################
+    live data
+    '''
+
+    def stream_file(self):
+        dlg = QFileDialog()
+        dlg.setDirectory(read_parameter(PARAMETER_FILE)['file_name'])
+        if dlg.exec_():
+            self.start_stream(dlg.selectedFiles()[0])
+
+    def stream_socket(self):
+        target, ok = QInputDialog.getText(self, 'Stream Socket', 'host:port', text='localhost:5025')
+        if ok:
+            self.start_stream(target.strip())
+
+    def start_stream(self, target):
+        '''
+        follow target (see nsor_stream.open_source), the newest samples are
+        kept in self.ring and shown like an opened file by stream_update
+        '''
+        self.stop_stream()
+        self.save_sidecar()
+        try:
+            self.stream = open_source(target)
+        except OSError as e:
+            dlg = QMessageBox.warning(self,'WARNING', 'Cannot open the stream!\n' + str(e),
+                                        QMessageBox.Ok)
+            return
+        self.ring = RingBuffer()
+        self.stream_y = None # display copy of the ring, reused while its length is constant
+        self.stream_fft = 0 # time of the last spectrum
+        self.acquisition = None
+        self.stream_timer.start()
+
+    def stop_stream(self):
+        self.stream_timer.stop()
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+    def stream_update(self):
+        '''
+        one poll of the live data, rate limited by stream_timer: append what
+        arrived, redraw the time plot and, at most every STREAM_FFT_INTERVAL,
+        recompute the spectrum of the time cursor window
+        '''
+        try: # an exception would end the application from the timer slot
+            stream = self.stream # stop_stream() clears self.stream when this poll ends the stream
+            with span('load'):
+                samples = stream.read()
+                if len(samples):
+                    self.ring.append(samples)
+            if len(samples) and stream.dt is not None:
+                self.stream_y = self.ring.values(self.stream_y)
+                self.data = getattr(self, 'data', {})
+                self.data['raw_x'] = UniformAxis(0, stream.dt, len(self.stream_y))
+                self.data['raw_y'] = self.stream_y
+                self.data['time_x'] = self.data['raw_x']
+                self.data['time_y'] = self.data['raw_y']
+                self.f_max = stream.f_max
+                self.draw('time', live=True) # the ring changes every poll, no pyramid
+                now = time.perf_counter()
+                if stream.closed or now - self.stream_fft >= STREAM_FFT_INTERVAL: # the last data always gets its spectrum
+                    self.stream_fft = now
+                    value = [float(x) for x in self.edits['time_cursor'].text().split(' ')]
+                    cs1, cs2 = index_range(self.data['time_x'], value[0], value[1])
+                    if cs2 > cs1: # the window has data
+                        self.zero_padding(self.zeroPadPower.currentText(), [cs1, cs2])
+                self.statusBar().showMessage('live: {} samples, {:.2f} s'.format(self.ring.total, self.ring.total*stream.dt))
+            if stream.closed:
+                self.stop_stream()
+        except Exception as e:
+            self.stop_stream()
+            dlg = QMessageBox.warning(self,'WARNING', 'The stream stopped!\n{}: {}'.format(type(e).__name__, e),
+                                        QMessageBox.Ok)
+
 
 
 
@@ -1013,21 +1601,28 @@ class MainWindow(QMainWindow):
     ################################################################################
     '''
 
-    def draw(self,key):
-        self.ax[key].clear()
-        if key == 'time':
-            self.ax[key].plot(self.data[key+'_x'],self.data[key+'_y'])
-        elif key == 'freq':
-            self.ax[key].plot(self.data[key+'_x'],np.abs(self.data[key+'_y']))
+    def draw(self,key,live=False):
+        '''
+        plot the trace of key, only the min/max of about one block per pixel
+        of the visible range is handed to matplotlib (nsor_render);
+        the line is persistent, the axes is rescaled and only it is redrawn;
+        live skips the pyramid of a time trace that changes on every poll
+        '''
+        with span('decimate'):
+            if key == 'time':
+                acquisition = getattr(self, 'acquisition', None)
+                pyramid = None
+                if isinstance(acquisition, CachedAcquisition) and self.data[key+'_y'] is acquisition.y:
+                    pyramid = acquisition.pyramid() # memory mapped from the sidecar entry
+                self.lines[key].set_data(self.data[key+'_x'], self.data[key+'_y'], pyramid, live)
+            elif key == 'freq':
+                self.phase_line.line.set_visible(False)
+                self.lines[key].line.set_visible(True)
+                self.lines[key].set_data(self.data[key+'_x'], np.abs(self.data[key+'_y']))
         value = [float(x) for x in self.edits[key+'_cursor'].text().split(' ')]
         self.vline[key+'_l'].set_xdata([value[0], value[0]])
         self.vline[key+'_r'].set_xdata([value[1], value[1]])
-
-        self.canvas.draw()
-        self.ax[key].ticklabel_format(style='sci', axis='both', scilimits=(0,0)) # format the tick label of the axes
-        self.ax[key].draw_artist(self.vline[key+'_l'])
-        self.ax[key].draw_artist(self.vline[key+'_r'])
-        self.canvas.blit(self.ax[key].bbox)
+        self.render.autoscale(key, self.lines[key].line)
 
 
 
@@ -1037,9 +1632,17 @@ class MainWindow(QMainWindow):
 ################################################################################
 '''
 
-app = QApplication(sys.argv)
+def main(argv=None):
+    '''
+    start the gui, the QApplication is only made here so that importing this
+    module does not open anything
+    '''
+    app = QApplication.instance() or QApplication(sys.argv if argv is None else argv)
+    window = MainWindow()
+    window.move(300,300)
+    window.show()
+    return app.exec_()
+
 
-window = MainWindow()
-window.move(300,300)
-window.show()
-app.exec_()
+if __name__ == '__main__':
+    sys.exit(main())
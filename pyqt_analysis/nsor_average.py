@@ -0,0 +1,110 @@
+'''
+signal averaging of repeated scans
+
+the scans are streamed one file at a time into a float64 accumulator, so the
+memory does not grow with the number of scans; every scan can be aligned in
+phase and frequency to the first one before it is added
+'''
+import numpy as np
+from numpy import pi
+
+from nsor_data import AcquisitionFile, index_range
+from nsor_fft import FFTBackend, frequency_axis
+from nsor_pipeline import process_arrayed
+
+
+def band_peak(freq_x, freq_y, csL, csR):
+    '''
+    (complex integral, peak frequency) of freq_y[csL:csR], the frequency is
+    interpolated between bins with a parabola through the largest magnitude
+    '''
+    window = freq_y[csL:csR]
+    magnitude = np.abs(window)
+    i = int(np.argmax(magnitude))
+    delta = 0.
+    if 0 < i < len(window) - 1:
+        a, b, c = magnitude[i-1:i+2]
+        if a - 2*b + c != 0:
+            delta = 0.5*(a - c)/(a - 2*b + c)
+    return np.sum(window), freq_x[csL] + (i + delta)*(freq_x[1] - freq_x[0])
+
+
+def shift_scan(y, spectrum, dt, dfreq, dphi, backend):
+    '''
+    y shifted down by dfreq (Hz) and rotated by dphi (rad), done on the
+    analytic signal built from spectrum = rfft(y) with one inverse fft
+    '''
+    n = len(y)
+    z = np.zeros(n, dtype=np.complex128)
+    z[:len(spectrum)] = spectrum
+    z[1:(n+1)//2] *= 2 # positive frequencies only
+    z = backend.ifft(z)
+    angle = np.arange(n)*(-2*pi*dfreq*dt)
+    angle -= dphi
+    return z.real*np.cos(angle) - z.imag*np.sin(angle)
+
+
+class RunningAverage():
+    '''
+    running co-add of scans with optional alignment to the first scan
+
+    add() takes one scan at a time, mean() is the current average, snr holds
+    the snr of the average after every scan (cursors and zerofilling of
+    settings, see nsor_pipeline.spectrum_results)
+    '''
+    def __init__(self, settings, align_phase=False, align_frequency=False, backend=None):
+        self.settings = dict(settings, phase='auto')
+        self.align_phase = align_phase
+        self.align_frequency = align_frequency
+        self.backend = backend or FFTBackend()
+        self.count = 0
+        self.sum = None
+        self.snr = []
+
+    def add(self, y, time_axis, f_max):
+        '''
+        add one scan (1-D array or memmap) on time_axis, returns the snr of the
+        average so far
+        '''
+        if self.sum is None:
+            self.sum = np.zeros(len(y))
+            self.time_axis = time_axis
+            self.f_max = f_max
+        elif len(y) != len(self.sum) or f_max != self.f_max:
+            raise ValueError('scans of an average need the same length and sampling')
+        y = np.asarray(y, dtype=np.float64)
+        if self.align_phase or self.align_frequency:
+            y = self._align(y)
+        self.sum += y
+        self.count += 1
+        self.snr.append(process_arrayed([self.sum], self.time_axis, self.f_max, self.settings, self.backend)['snr'][0])
+        return self.snr[-1]
+
+    def _align(self, y):
+        spectrum = self.backend.rfft(y)
+        freq_x = frequency_axis(len(y), self.f_max)
+        csL, csR = index_range(freq_x, *self.settings['freq_cursor'])
+        integral, peak = band_peak(freq_x, spectrum, csL, csR)
+        if self.count == 0:
+            self.reference = (integral, peak)
+            return y
+        dfreq = peak - self.reference[1] if self.align_frequency else 0.
+        dphi = np.angle(integral/self.reference[0]) if self.align_phase else 0.
+        return shift_scan(y, spectrum, self.time_axis.dt, dfreq, dphi, self.backend)
+
+    def mean(self):
+        return self.sum/max(self.count, 1)
+
+
+def average_files(file_names, settings, align_phase=False, align_frequency=False, backend=None, progress=None):
+    '''
+    average the scans in file_names, read one file at a time, progress is
+    called with (count, snr) after every scan, returns the RunningAverage
+    '''
+    average = RunningAverage(settings, align_phase, align_frequency, backend)
+    for file_name in file_names:
+        acquisition = AcquisitionFile(file_name, settings['data_type'])
+        snr = average.add(acquisition.y, acquisition.time_axis, acquisition.f_max)
+        if progress is not None:
+            progress(average.count, snr)
+    return average
@@ -0,0 +1,270 @@
+'''
+sidecar cache of acquisition files
+
+every window of a big endian bin file is byte swapped again when it is read
+and the plot decimation reads the whole file once more every time it is
+opened; the sidecar cache keeps a folder per acquisition in SIDECAR_FOLDER,
+the per user cache directory (user_cache_folder()):
+
+    meta.json               source identity (path, size, modification time),
+                            t0, dt, n, the sampling error once checked, the
+                            pyramid level sizes, the stored spectra and the
+                            time of the last use
+    y.npy                   the y column, native endian and contiguous
+    min_k.npy, max_k.npy    index arrays of level k of the MinMaxPyramid
+    spectrum_<key>.npy      freq_y of the last used spectra, their freq_x is
+                            a UniformAxis kept in meta.json
+
+the arrays are memory mapped when the file is opened again, so reopening
+costs no more than reading meta.json; an entry whose source changed is
+dropped and rebuilt, the least recently used entries are removed while the
+cache is larger than max_bytes (never the entry just opened)
+
+the first open of a file copies all of it into the entry, the gui only uses
+the cache when File > Use Sidecar Cache is checked
+'''
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+
+from nsor_data import SAMPLING_TOLERANCE, AcquisitionFile, UniformAxis, sampling_error
+
+CACHE_VERSION = 1
+SIDECAR_CACHE_BYTES = 2**32 # 4 GB on disk
+SIDECAR_SPECTRA = 4 # last used spectra kept per acquisition
+CHUNK = 1 << 22 # samples byte swapped at a time when y.npy is written
+
+
+def user_cache_folder(name='nsor_analysis'):
+    '''
+    per user cache directory of the platform, %LOCALAPPDATA% on windows,
+    ~/Library/Caches on macos, $XDG_CACHE_HOME or ~/.cache elsewhere
+    '''
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser(r'~\AppData\Local')
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser('~/Library/Caches')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, name)
+
+
+SIDECAR_FOLDER = os.path.join(user_cache_folder(), 'sidecar_cache')
+
+
+def _digest(text):
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+
+def _tuples(value):
+    # json turns the tuples of a spectrum key into lists
+    if isinstance(value, list):
+        return tuple(_tuples(v) for v in value)
+    return value
+
+
+def _scalar(value):
+    # numpy integers and floats in a spectrum key
+    return value.item()
+
+
+class CachedAcquisition(AcquisitionFile):
+    '''
+    AcquisitionFile whose y column is the native memmap of a sidecar entry;
+    self.x (only read by the sampling check or for a non uniform file) is
+    still the strided view of the source file
+    '''
+    def __init__(self, source, folder, meta, cache):
+        self.file_name = source.file_name
+        self.identity = source.identity
+        self.n = source.n
+        self.x = source.x
+        self.y = np.load(os.path.join(folder, 'y.npy'), mmap_mode='r')
+        self.dt = source.dt
+        self.f_max = source.f_max
+        self.time_axis = source.time_axis
+        self.folder = folder
+        self.meta = meta
+        self.cache = cache
+
+    def is_uniform(self, tolerance=SAMPLING_TOLERANCE):
+        if self.meta['sampling_error'] is None:
+            self.meta['sampling_error'] = sampling_error(self.x, self.time_axis)
+            self.cache.write_meta(self.folder, self.meta)
+        return self.meta['sampling_error'] <= tolerance
+
+    def pyramid(self):
+        '''
+        nsor_render.MinMaxPyramid of self.y, memory mapped from the entry or
+        built and saved the first time
+        '''
+        from nsor_render import MinMaxPyramid # imports matplotlib, only with the gui
+        if self.meta['pyramid'] is not None:
+            levels = [(np.load(os.path.join(self.folder, f'min_{k}.npy'), mmap_mode='r'),
+                       np.load(os.path.join(self.folder, f'max_{k}.npy'), mmap_mode='r'))
+                      for k in range(len(self.meta['pyramid']))]
+            return MinMaxPyramid.from_levels(self.n, self.meta['pyramid'], levels)
+        pyramid = MinMaxPyramid(self.y)
+        try:
+            for k, (imin, imax) in enumerate(pyramid.levels):
+                np.save(os.path.join(self.folder, f'min_{k}.npy'), imin)
+                np.save(os.path.join(self.folder, f'max_{k}.npy'), imax)
+            self.meta['pyramid'] = pyramid.sizes
+            self.cache.write_meta(self.folder, self.meta)
+        except OSError: # cache folder full or gone, the pyramid is still good
+            pass
+        return pyramid
+
+    def spectra(self):
+        '''
+        [(key, (freq_x, freq_y))] of the stored spectra, least recently used
+        first, the keys are the spectrum cache keys without the identity
+        '''
+        spectra = []
+        for name, (key, axis) in self.meta['spectra'].items():
+            freq_y = np.load(os.path.join(self.folder, f'spectrum_{name}.npy'), mmap_mode='r')
+            spectra.append((_tuples(key), (UniformAxis(*axis), freq_y)))
+        return spectra
+
+    def save_spectra(self, spectra):
+        '''
+        keep the last SIDECAR_SPECTRA of spectra [(key, (freq_x, freq_y))],
+        most recent last; a spectrum already in the entry is not written again
+        (it may be memory mapped), the files of dropped ones are removed
+        '''
+        stored = {}
+        for key, (freq_x, freq_y) in spectra[-SIDECAR_SPECTRA:]:
+            if not isinstance(freq_x, UniformAxis):
+                continue
+            key = json.loads(json.dumps(key, default=_scalar))
+            name = _digest(json.dumps(key))
+            path = os.path.join(self.folder, f'spectrum_{name}.npy')
+            try:
+                if name not in self.meta['spectra']:
+                    np.save(path, freq_y)
+            except OSError:
+                continue
+            stored[name] = (key, (freq_x.t0, freq_x.dt, freq_x.n))
+        for name in set(self.meta['spectra']) - set(stored):
+            try:
+                os.remove(os.path.join(self.folder, f'spectrum_{name}.npy'))
+            except OSError: # still mapped on windows, removed with the entry
+                pass
+        self.meta['spectra'] = stored
+        self.cache.write_meta(self.folder, self.meta)
+        self.cache.trim(keep=self.folder)
+
+
+class SidecarCache():
+    '''
+    folder of sidecar entries, at most max_bytes on disk
+    '''
+    def __init__(self, folder=SIDECAR_FOLDER, max_bytes=SIDECAR_CACHE_BYTES):
+        self.folder = folder
+        self.max_bytes = max_bytes
+
+    def entry(self, file_name):
+        return os.path.join(self.folder, _digest(os.path.realpath(file_name)))
+
+    def open(self, file_name):
+        '''
+        CachedAcquisition of a bin file, its entry is built first when it is
+        missing or the file changed since; the plain AcquisitionFile if the
+        entry cannot be written
+        '''
+        source = AcquisitionFile(file_name, 'bin')
+        folder = self.entry(file_name)
+        meta = self.read_meta(folder)
+        try:
+            if meta is None or meta['version'] != CACHE_VERSION or tuple(meta['identity']) != source.identity:
+                self.remove(folder)
+                meta = self._build(source, folder)
+            meta['used'] = time.time()
+            self.write_meta(folder, meta)
+        except OSError:
+            return source
+        self.trim(keep=folder)
+        return CachedAcquisition(source, folder, meta, self)
+
+    def _build(self, source, folder):
+        os.makedirs(folder, exist_ok=True)
+        y = np.lib.format.open_memmap(os.path.join(folder, 'y.npy'), mode='w+', dtype=np.float64, shape=(source.n,))
+        for start in range(0, source.n, CHUNK): # byte swapped chunk by chunk, the file is never in memory
+            y[start:start+CHUNK] = source.y[start:start+CHUNK]
+        y.flush()
+        del y
+        return {
+            'version': CACHE_VERSION,
+            'identity': list(source.identity),
+            'n': source.n,
+            't0': source.time_axis.t0,
+            'dt': source.dt,
+            'sampling_error': None,
+            'pyramid': None,
+            'spectra': {},
+            'used': time.time(),
+        }
+
+    @staticmethod
+    def read_meta(folder):
+        try:
+            with open(os.path.join(folder, 'meta.json'), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError): # missing or half written entry
+            return None
+
+    @staticmethod
+    def write_meta(folder, meta):
+        # meta.json is replaced at once, an entry is valid only when it is there
+        path = os.path.join(folder, 'meta.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(path + '.tmp', path)
+
+    @staticmethod
+    def remove(folder):
+        try:
+            os.remove(os.path.join(folder, 'meta.json')) # invalid even if some files stay mapped
+        except OSError:
+            pass
+        shutil.rmtree(folder, ignore_errors=True)
+
+    @staticmethod
+    def size(folder):
+        return sum(entry.stat().st_size for entry in os.scandir(folder) if entry.is_file())
+
+    def entries(self):
+        '''
+        [(last use, size, folder)] of every entry, least recently used first
+        '''
+        if not os.path.isdir(self.folder):
+            return []
+        entries = []
+        for entry in os.scandir(self.folder):
+            if entry.is_dir():
+                meta = self.read_meta(entry.path)
+                entries.append((meta['used'] if meta else 0, self.size(entry.path), entry.path))
+        return sorted(entries)
+
+    def trim(self, keep=None):
+        '''
+        remove the least recently used entries, except keep, until the cache
+        fits in max_bytes
+        '''
+        entries = self.entries()
+        total = sum(size for used, size, folder in entries)
+        for used, size, folder in entries:
+            if total <= self.max_bytes:
+                break
+            if folder != keep:
+                self.remove(folder)
+                total -= size
+
+    def clear(self):
+        for used, size, folder in self.entries():
+            self.remove(folder)
@@ -0,0 +1,215 @@
+'''
+loading of the acquisition files
+
+bin files recorded by the labview program are big endian float64 records,
+interleaved as x0 y0 x1 y1 ...; npy files hold the same layout in native order
+'''
+import bisect
+import os
+
+import numpy as np
+
+SAMPLING_TOLERANCE = 1e-3 # allowed deviation of a time stamp from t0 + i*dt, in units of dt
+
+
+def native_window(y, cs1, cs2, length=None):
+    '''
+    native endian, contiguous float64 copy of y[cs1:cs2], zero filled to length
+
+    y can be a memmap of the file, only the selected slice is read from disk
+    and byte swapped while it is copied into the new buffer
+    '''
+    if length is None:
+        length = cs2 - cs1
+    n = min(cs2 - cs1, length)
+    out = np.zeros(length)
+    out[:n] = y[cs1:cs1+n]
+    return out
+
+
+def native_array(traces, cs1, cs2, length=None):
+    '''
+    the [cs1:cs2] windows of several traces as the rows of one contiguous,
+    native endian 2-D array, zero filled to length, read trace by trace
+    '''
+    if length is None:
+        length = cs2 - cs1
+    n = min(cs2 - cs1, length)
+    out = np.zeros((len(traces), length))
+    for row, y in zip(out, traces):
+        row[:n] = y[cs1:cs1+n]
+    return out
+
+
+class UniformAxis():
+    '''
+    uniformly sampled axis t0 + i*dt for i in range(n), stored as three numbers
+
+    supports len(), indexing, slicing (giving another UniformAxis) and
+    searchsorted, np.asarray(axis) builds the explicit array when one is
+    really needed, e.g. for plotting
+    '''
+    def __init__(self, t0, dt, n):
+        self.t0 = float(t0)
+        self.dt = float(dt)
+        self.n = int(n)
+
+    @classmethod
+    def linspace(cls, start, stop, n):
+        '''
+        same grid as np.linspace(start, stop, n)
+        '''
+        dt = (stop - start)/(n - 1) if n > 1 else 0.
+        return cls(start, dt, n)
+
+    def __len__(self):
+        return self.n
+
+    def __repr__(self):
+        return f'UniformAxis(t0={self.t0}, dt={self.dt}, n={self.n})'
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.n)
+            return UniformAxis(self.t0 + start*self.dt, step*self.dt, len(range(start, stop, step)))
+        if isinstance(key, (int, np.integer)):
+            if key < 0:
+                key += self.n
+            if not 0 <= key < self.n:
+                raise IndexError('axis index out of range')
+            return self.t0 + key*self.dt
+        key = np.asarray(key)
+        return self.t0 + np.where(key < 0, key + self.n, key)*self.dt
+
+    def __array__(self, dtype=None, copy=None):
+        return self.values().astype(dtype or np.float64, copy=False)
+
+    def values(self):
+        return self.t0 + np.arange(self.n)*self.dt
+
+    def _position(self, value):
+        # fractional index of value, snapped to the grid against rounding noise
+        pos = (np.asarray(value, dtype=np.float64) - self.t0)/self.dt
+        near = np.rint(pos)
+        return np.where(np.abs(pos - near) < 1e-9, near, pos)
+
+    def searchsorted(self, value, side='left'):
+        '''
+        same result as np.searchsorted(np.asarray(self), value, side)
+        '''
+        pos = self._position(value)
+        if side == 'left':
+            index = np.ceil(pos)
+        else:
+            index = np.floor(pos) + 1
+        index = np.clip(index, 0, self.n).astype(np.intp)
+        return index if index.ndim else int(index)
+
+    def nearest(self, value):
+        '''
+        index of the sample closest to value, np.argmin(np.abs(x - value))
+        without building x
+        '''
+        index = np.clip(np.rint(self._position(value)), 0, max(self.n - 1, 0)).astype(np.intp)
+        return index if index.ndim else int(index)
+
+
+def nearest_index(axis, value):
+    '''
+    index of the sample of axis closest to value
+
+    O(1) arithmetic for a UniformAxis, binary search for an explicit
+    ascending array (e.g. the stored time stamps of a non uniform file);
+    np.searchsorted would first cast a big endian or strided memmap to a
+    native copy, so such an axis is bisected element by element instead
+    '''
+    if isinstance(axis, UniformAxis):
+        return axis.nearest(value)
+    n = len(axis)
+    if isinstance(axis, np.ndarray) and axis.dtype.isnative and axis.flags.c_contiguous:
+        i = int(np.searchsorted(axis, value))
+    else:
+        i = bisect.bisect_left(axis, value) # about log2(n) samples read from the file
+    if i <= 0:
+        return 0
+    if i >= n:
+        return n - 1
+    if value - axis[i-1] <= axis[i] - value:
+        return i - 1
+    return i
+
+
+def index_range(axis, value1, value2):
+    '''
+    (csL, csR) indices of a pair of cursors, ordered so that csL <= csR
+    '''
+    cs1 = nearest_index(axis, value1)
+    cs2 = nearest_index(axis, value2)
+    if cs1 > cs2:
+        return cs2, cs1
+    return cs1, cs2
+
+
+def sampling_error(x, axis, chunk=1 << 20):
+    '''
+    largest deviation of the stored time stamps x from the uniform axis,
+    in units of dt, x is read chunk by chunk so a memmap stays on disk
+    '''
+    error = 0.
+    for start in range(0, len(x), chunk):
+        stop = min(start + chunk, len(x))
+        expected = axis.t0 + np.arange(start, stop)*axis.dt
+        error = max(error, float(np.max(np.abs(x[start:stop] - expected))))
+    return error/abs(axis.dt)
+
+
+class AcquisitionFile():
+    '''
+    lazily opened acquisition file
+
+    the file is mapped with np.memmap instead of being read into memory,
+    self.x and self.y are strided views of the interleaved records,
+    dt and f_max only use the first two time stamps, self.time_axis is the
+    implicit uniform time axis built from them
+    self.identity (path, size, modification time) changes whenever the file
+    is rewritten, results derived from the file can be cached under it
+    '''
+    def __init__(self, file_name, data_type='bin'):
+        self.file_name = file_name
+        stat = os.stat(file_name)
+        self.identity = (os.path.realpath(file_name), stat.st_size, stat.st_mtime_ns)
+        if data_type == 'bin':
+            raw_data = np.memmap(file_name, dtype='>f8', mode='r')
+        elif data_type == '.npy':
+            raw_data = np.load(file_name, mmap_mode='r')
+        else:
+            raise ValueError(f'unknown data type {data_type}')
+        raw_data = raw_data.reshape(-1)
+        self.n = len(raw_data)//2
+        self.x = raw_data[0:2*self.n:2]
+        self.y = raw_data[1:2*self.n:2]
+        self.dt = float(raw_data[2]) - float(raw_data[0])
+        self.f_max = 1/(2*self.dt)
+        self.time_axis = UniformAxis(float(raw_data[0]), self.dt, self.n)
+
+    def __len__(self):
+        return self.n
+
+    def window(self, cs1, cs2, length=None):
+        return native_window(self.y, cs1, cs2, length)
+
+    def traces(self, n_traces):
+        '''
+        split an arrayed acquisition of n_traces repeated fids recorded one
+        after the other into n_traces views of y, their time axis is the one
+        of the first trace, self.time_axis[:len(self)//n_traces]
+        '''
+        m = self.n//n_traces
+        return [self.y[i*m:(i+1)*m] for i in range(n_traces)]
+
+    def is_uniform(self, tolerance=SAMPLING_TOLERANCE):
+        '''
+        check the stored time stamps against self.time_axis, this reads the
+        whole x column so it is only done on request
+        '''
+        return sampling_error(self.x, self.time_axis) <= tolerance
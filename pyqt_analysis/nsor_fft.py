@@ -0,0 +1,317 @@
+'''
+fft backends
+
+FFTBackend wraps the fastest installed fft library, pyfftw (plans cached
+per length, wisdom can be saved and reloaded), scipy.fft (multi worker) or
+numpy as the fallback, the libraries are only imported when a backend is made
+'''
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from importlib.util import find_spec
+from functools import lru_cache
+
+import numpy as np
+from numpy import pi
+
+from nsor_data import UniformAxis
+
+BACKENDS = ['pyfftw', 'scipy', 'numpy'] # in order of preference
+FFTW_PLANS = 8 # pyfftw plans (with their aligned buffers) kept per backend
+FFTW_MEASURE_USES = 3 # a length used this often is planned again with FFTW_MEASURE
+ZOOM_PLANS = 4 # chirp-z plans kept per backend
+ZOOM_PLAN_BYTES = 2**28 # 256 MB, most memory of the kept chirp-z plans, the newest one is always kept
+ZOOM_POINTS = 1 << 22 # most points of a zoom spectrum
+SPECTRUM_CACHE_BYTES = 2**28 # memory budget of a SpectrumCache
+
+
+def available_backends():
+    '''
+    names of the installed backends, in order of preference
+    '''
+    names = []
+    for name in BACKENDS[:-1]:
+        if find_spec(name) is not None: # without importing it
+            names.append(name)
+    return names + ['numpy']
+
+
+ZERO_FILL_MODES = ['2^n', 'fast']
+
+
+@lru_cache(maxsize=32)
+def frequency_axis(n, f_max):
+    '''
+    frequency axis of the rfft of n samples, np.linspace(0, f_max, n//2+1) for even n
+    '''
+    return UniformAxis(0, 2*f_max/n, n//2+1)
+
+
+def next_pow2(n):
+    return 1 << max(int(n) - 1, 0).bit_length()
+
+
+def next_fast_len(n):
+    '''
+    smallest even 5-smooth number (2^a*3^b*5^c, a >= 1) >= n, these lengths
+    are about as fast as powers of two but much closer to n
+    '''
+    half = max(-(-int(n)//2), 1)
+    best = next_pow2(half)
+    p5 = 1
+    while p5 < best:
+        p35 = p5
+        while p35 < best:
+            best = min(best, next_pow2(-(-half//p35))*p35)
+            p35 *= 3
+        p5 *= 5
+    return 2*best
+
+
+def zero_fill_length(n_window, factor=1, mode='2^n', resolution=None, dt=None):
+    '''
+    fft length for a cursor window of n_window samples
+
+    factor times the window, or when a resolution (Hz) is given, enough points
+    for a frequency grid spacing of at most resolution with sampling step dt;
+    rounded up to a power of two (mode '2^n') or a fast length (mode 'fast')
+    '''
+    n = n_window*factor
+    if resolution:
+        n = max(n_window, int(np.ceil(1/(dt*resolution))))
+    if mode == 'fast':
+        return next_fast_len(n)
+    return max(next_pow2(n), 2)
+
+
+class FFTBackend():
+    '''
+    real fft with the scaling of the gui (2/n, amplitude of a cosine) applied
+    in place on the output, no temporaries besides the spectrum itself
+    '''
+    def __init__(self, name=None, workers=None):
+        if name is None:
+            name = available_backends()[0]
+        self.name = name
+        self.workers = workers or os.cpu_count() or 1
+        self._plans = OrderedDict() # (kind, shape): [plan, measured, uses]
+        self._zoom_plans = OrderedDict()
+        self._lock = threading.Lock()
+        if name == 'pyfftw':
+            import pyfftw
+            self._pyfftw = pyfftw
+        elif name == 'scipy':
+            import scipy.fft
+            self._scipy_fft = scipy.fft
+        elif name != 'numpy':
+            raise ValueError(f'unknown fft backend {name}')
+
+    def __repr__(self):
+        return f'FFTBackend({self.name!r}, workers={self.workers})'
+
+    def _build(self, kind, shape, effort):
+        a = self._pyfftw.empty_aligned(shape, dtype='float64' if kind == 'rfft' else 'complex128')
+        return getattr(self._pyfftw.builders, kind)(a, threads=self.workers, planner_effort=effort)
+
+    def _plan(self, kind, shape):
+        '''
+        least recently used cache of FFTW_PLANS plans; a new length is planned
+        from wisdom or with FFTW_ESTIMATE, which take no time, and only
+        measured once it was used FFTW_MEASURE_USES times (the cursor window
+        sets the length, most lengths are used once)
+        '''
+        key = (kind, shape)
+        entry = self._plans.get(key)
+        if entry is None:
+            try:
+                entry = [self._build(kind, shape, 'FFTW_WISDOM_ONLY'), True, 0]
+            except RuntimeError: # no wisdom for this length
+                entry = [self._build(kind, shape, 'FFTW_ESTIMATE'), False, 0]
+            self._plans[key] = entry
+            while len(self._plans) > FFTW_PLANS:
+                self._plans.popitem(last=False)
+        else:
+            self._plans.move_to_end(key)
+        entry[2] += 1
+        if not entry[1] and entry[2] >= FFTW_MEASURE_USES:
+            entry[0] = self._build(kind, shape, 'FFTW_MEASURE') # also adds it to the wisdom
+            entry[1] = True
+        return entry[0]
+
+    def _transform(self, kind, x):
+        # along the last axis, a 2-D array is transformed row by row in one call
+        if self.name == 'pyfftw':
+            with self._lock: # a plan owns its buffers, one transform at a time
+                return self._plan(kind, x.shape)(x).copy()
+        elif self.name == 'scipy':
+            return getattr(self._scipy_fft, kind)(x, workers=self.workers)
+        return getattr(np.fft, kind)(x)
+
+    def rfft(self, x, scale=1.):
+        '''
+        rfft(x)*scale
+        '''
+        out = self._transform('rfft', x)
+        if scale != 1:
+            np.multiply(out, scale, out=out)
+        return out
+
+    def fft(self, x):
+        return self._transform('fft', x)
+
+    def ifft(self, x):
+        return self._transform('ifft', x)
+
+    def spectrum(self, time_sig, f_max):
+        '''
+        (freq_x, freq_y) of a zero filled time signal as shown by the gui,
+        the rows of a 2-D time_sig are transformed together
+        '''
+        n = time_sig.shape[-1]
+        return frequency_axis(n, f_max), self.rfft(time_sig, 2/n)
+
+    def zoom_spectrum(self, time_sig, f_max, f_start, f_stop, m):
+        '''
+        (freq_x, freq_y) on m points from f_start to f_stop only (chirp-z)
+
+        freq_y equals the spectrum of time_sig zero filled to the length with
+        the same point spacing, without computing or storing the full fft
+        '''
+        if not 1 <= m <= ZOOM_POINTS or f_stop < f_start:
+            raise ValueError(f'zoom band {f_start}..{f_stop} on {m} points')
+        dt = 1/(2*f_max)
+        df = (f_stop - f_start)/(m - 1) if m > 1 else 2*f_max
+        key = (len(time_sig), m, f_start, df, dt)
+        with self._lock: # jobs of several generations can run at once
+            plan = self._zoom_plans.get(key)
+            if plan is not None:
+                self._zoom_plans.move_to_end(key)
+        if plan is None:
+            plan = ZoomFFT(len(time_sig), m, f_start, df, dt, self) # outside the lock, it runs ffts
+            with self._lock:
+                self._zoom_plans[key] = plan
+                while len(self._zoom_plans) > 1 and (len(self._zoom_plans) > ZOOM_PLANS or
+                        sum(p.nbytes for p in self._zoom_plans.values()) > ZOOM_PLAN_BYTES):
+                    self._zoom_plans.popitem(last=False)
+        out = plan(time_sig)
+        np.multiply(out, 2*df*dt, out=out) # 2/n of the equivalent zero filled length n = 1/(df*dt)
+        return UniformAxis(f_start, df, m), out
+
+    def load_wisdom(self, file_name):
+        if self.name == 'pyfftw' and os.path.exists(file_name):
+            with open(file_name, 'rb') as f:
+                self._pyfftw.import_wisdom(pickle.load(f))
+
+    def save_wisdom(self, file_name):
+        if self.name == 'pyfftw':
+            with open(file_name, 'wb') as f:
+                pickle.dump(self._pyfftw.export_wisdom(), f)
+
+
+class ZoomFFT():
+    '''
+    chirp-z (Bluestein) transform of n samples onto the m frequencies
+    f_start + k*df, sampling step dt
+
+    the sum over n samples becomes one convolution of length
+    next_fast_len(n + m - 1), the kernel spectrum and the output chirp are
+    computed once per plan (self.nbytes), the n point input chirp is
+    computed on every call instead of being kept
+    '''
+    def __init__(self, n, m, f_start, df, dt, backend):
+        self.n = n
+        self.m = m
+        self.f_start = f_start
+        self.df = df
+        self.dt = dt
+        self.backend = backend
+        self.length = next_fast_len(n + m - 1)
+        k = np.arange(max(n, m), dtype=np.int64)
+        chirp = self.chirp(k)
+        self.post = chirp[:m]
+        kernel = np.zeros(self.length, dtype=np.complex128)
+        kernel[:m] = np.conj(chirp[:m])
+        kernel[self.length-n+1:] = np.conj(chirp[1:n][::-1])
+        self.kernel = backend.fft(kernel)
+        self.nbytes = self.kernel.nbytes + self.post.nbytes
+
+    def chirp(self, k, f_start=0.):
+        # exp(-1j*pi*df*dt*k^2 - 2j*pi*f_start*dt*k), the phases are reduced to [0, 1) turns first
+        k2 = (k*k).astype(np.float64)
+        return np.exp(-2j*pi*((0.5*self.df*self.dt*k2) % 1 + (f_start*self.dt*k) % 1))
+
+    def __call__(self, x):
+        buf = np.zeros(self.length, dtype=np.complex128)
+        np.multiply(x, self.chirp(np.arange(self.n, dtype=np.int64), self.f_start), out=buf[:self.n])
+        buf = self.backend.fft(buf)
+        np.multiply(buf, self.kernel, out=buf)
+        buf = self.backend.ifft(buf)
+        return np.multiply(buf[:self.m], self.post)
+
+
+class SpectrumCache():
+    '''
+    least recently used cache of spectra (freq_x, freq_y) within a memory
+    budget of max_bytes
+
+    the key has to identify the input completely, e.g. (file identity, cs1,
+    cs2, zero filled length, ...); the least recently used spectra are
+    evicted until a new one fits, a spectrum larger than the budget is not
+    stored; the stored arrays are read only since they are shared;
+    memory mapped arrays (spectra of a sidecar entry, nsor_cache) stay on
+    disk and do not count against the budget
+    '''
+    def __init__(self, max_bytes=SPECTRUM_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._spectra = OrderedDict()
+
+    def __len__(self):
+        return len(self._spectra)
+
+    @staticmethod
+    def _size(spectrum):
+        return sum(a.nbytes for a in spectrum if isinstance(a, np.ndarray) and not isinstance(a, np.memmap))
+
+    def get(self, key):
+        spectrum = self._spectra.get(key)
+        if spectrum is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._spectra.move_to_end(key)
+        return spectrum
+
+    def put(self, key, freq_x, freq_y):
+        if key in self._spectra:
+            self.bytes -= self._size(self._spectra.pop(key))
+        spectrum = (freq_x, freq_y)
+        size = self._size(spectrum)
+        if size > self.max_bytes:
+            return
+        for a in spectrum:
+            if isinstance(a, np.ndarray):
+                a.flags.writeable = False
+        while self.bytes + size > self.max_bytes:
+            self.bytes -= self._size(self._spectra.popitem(last=False)[1])
+            self.evictions += 1
+        self._spectra[key] = spectrum
+        self.bytes += size
+
+    def items(self):
+        '''
+        [(key, (freq_x, freq_y))] least recently used first
+        '''
+        return list(self._spectra.items())
+
+    def clear(self):
+        self._spectra.clear()
+        self.bytes = 0
+
+    def status(self):
+        return 'cache: {} hit, {} miss, {} evicted (lru, {:.0f}/{:.0f} MB)'.format(
+               self.hits, self.misses, self.evictions, self.bytes/2**20, self.max_bytes/2**20)
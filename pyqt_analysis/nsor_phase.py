@@ -0,0 +1,185 @@
+'''
+phase correction of complex spectra
+
+phases follow the convention of the gui, a spectrum y phased by phi is
+y.real*cos(phi) + y.imag*sin(phi) = Re(y*exp(-1j*phi))
+'''
+from functools import lru_cache
+
+import numpy as np
+from numpy import pi
+
+GRID_MEMORY = 2**25 # bytes used per block of candidates in the grid search
+
+
+def auto_phase_zeroth(freq_y, csL, csR):
+    '''
+    0th order phase (rad, 0..2pi) maximising the phased integral of freq_y[csL:csR]
+
+    the integral is cos(phi)*sum(re) + sin(phi)*sum(im), so its maximum is
+    atan2(sum(im), sum(re)), one pass over the window and no angle grid;
+    the rows of a 2-D freq_y get one common phase
+    '''
+    total = np.sum(freq_y[..., csL:csR])
+    return np.arctan2(total.imag, total.real) % (2*pi)
+
+
+def phase_ramp(n, pivot=0):
+    '''
+    normalised first order ramp (i - pivot)/n, a 1st order phase ph1 turns
+    the phase by ph1 across the whole spectrum
+    '''
+    return (np.arange(n) - pivot)/n
+
+
+@lru_cache(maxsize=8)
+def cached_phase_ramp(n, pivot=0):
+    '''
+    phase_ramp kept per (length, pivot), read only since it is shared
+    '''
+    ramp = phase_ramp(n, pivot)
+    ramp.flags.writeable = False
+    return ramp
+
+
+def phased_entropy(re, im, ph0):
+    '''
+    entropy of |phased spectrum| for every ph0 (first axis) at once,
+    re, im are the real/imag parts, (..., n)
+    '''
+    c = np.cos(ph0)[:, None, None]
+    s = np.sin(ph0)[:, None, None]
+    d = np.abs(c*re + s*im)
+    h = d/np.maximum(np.sum(d, axis=-1, keepdims=True), np.finfo(float).tiny)
+    return -np.sum(h*np.log(np.maximum(h, np.finfo(float).tiny)), axis=-1)
+
+
+def auto_phase_entropy(freq_y, csL, csR, ph0_grid=None, ph1_grid=None, pivot=None, refine=2, band=None):
+    '''
+    0th + 1st order phase (rad) minimising the entropy of the phased real part
+    of freq_y[band[0]:band[1]] (the whole spectrum by default), absorption
+    lines are the most concentrated; the band should hold the tails of the
+    lines, a band cut close to a line favours a ph1 that makes them negative
+
+    all (ph0, ph1) candidates of the grid are evaluated as one array operation
+    (in blocks of GRID_MEMORY bytes), the grid is then refined around the best
+    candidate refine times to get below the grid spacing, ph1 never beyond
+    the ends of ph1_grid (ph0 is periodic);
+    ph1 is relative to the ramp phase_ramp(len(freq_y), pivot), pivot defaults
+    to the centre of the window freq_y[csL:csR], the default ph1_grid turns
+    the phase by -pi..pi across the band; the sign is chosen so that the
+    phased integral of the window is positive
+    returns (ph0, ph1)
+    '''
+    bandL, bandR = (0, len(freq_y)) if band is None else band
+    if ph0_grid is None:
+        ph0_grid = np.linspace(0, 2*pi, 72, endpoint=False)
+    if ph1_grid is None:
+        ph1_grid = np.linspace(-pi, pi, 73)*len(freq_y)/max(bandR - bandL, 1)
+    if pivot is None:
+        pivot = (csL + csR)/2
+    y = freq_y[bandL:bandR]
+    ramp = phase_ramp(len(freq_y), pivot)[bandL:bandR]
+    ph0_grid = np.asarray(ph0_grid, dtype=np.float64)
+    ph1_grid = np.asarray(ph1_grid, dtype=np.float64)
+    ph1_min, ph1_max = ph1_grid.min(), ph1_grid.max()
+
+    for level in range(refine + 1):
+        # rotate once per ph1, the ph0 rotation is linear in re and im
+        block = max(1, int(GRID_MEMORY // (16*max(len(y), 1)*len(ph0_grid))))
+        entropy = np.empty((len(ph0_grid), len(ph1_grid)))
+        for start in range(0, len(ph1_grid), block):
+            ph1 = ph1_grid[start:start+block]
+            z = y[None, :]*np.exp(-1j*ph1[:, None]*ramp[None, :])
+            entropy[:, start:start+block] = phased_entropy(z.real[None], z.imag[None], ph0_grid)
+        i0, i1 = np.unravel_index(np.argmin(entropy), entropy.shape)
+        ph0, ph1 = ph0_grid[i0], ph1_grid[i1]
+        step0 = ph0_grid[1] - ph0_grid[0] if len(ph0_grid) > 1 else 0.
+        step1 = ph1_grid[1] - ph1_grid[0] if len(ph1_grid) > 1 else 0.
+        ph0_grid = ph0 + np.linspace(-step0, step0, 21)
+        ph1_grid = np.unique(np.clip(ph1 + np.linspace(-step1, step1, 21), ph1_min, ph1_max))
+
+    # entropy does not tell a peak from its negative, keep the positive one
+    y = freq_y[csL:csR]
+    ramp = phase_ramp(len(freq_y), pivot)[csL:csR]
+    if np.sum(y.real*np.cos(ph0 + ph1*ramp) + y.imag*np.sin(ph0 + ph1*ramp)) < 0:
+        ph0 += pi
+    return ph0 % (2*pi), ph1
+
+
+class PhaseCorrector():
+    '''
+    0th + 1st order phase correction of one spectrum
+
+    apply() computes Re(freq_y*exp(-1j*(ph0 + ph1*ramp))) into a buffer that is
+    allocated once per spectrum length, the ramp comes from cached_phase_ramp,
+    so repeated calls (slider ticks) do not allocate any array
+    self.ph0, self.ph1 hold the last applied phases (rad)
+    '''
+    def __init__(self):
+        self.n = 0
+        self.ph0 = 0.
+        self.ph1 = 0.
+
+    def set_spectrum(self, freq_y):
+        n = len(freq_y)
+        if n != self.n:
+            self.n = n
+            self.re = np.empty(n)
+            self.im = np.empty(n)
+            self.out = np.empty(n)
+            self._angle = np.empty(n)
+            self._cos = np.empty(n)
+            self._sin = np.empty(n)
+        np.copyto(self.re, freq_y.real)
+        np.copyto(self.im, freq_y.imag)
+
+    def apply(self, ph0, ph1=0., pivot=0):
+        '''
+        phased real part for ph0, ph1 (rad), ph1 turns around index pivot
+        the returned array is the internal buffer, overwritten by the next call
+        '''
+        self.ph0 = ph0
+        self.ph1 = ph1
+        if ph1 == 0:
+            np.multiply(self.re, np.cos(ph0), out=self.out)
+            np.multiply(self.im, np.sin(ph0), out=self._sin)
+        else:
+            np.multiply(cached_phase_ramp(self.n, pivot), ph1, out=self._angle)
+            np.add(self._angle, ph0, out=self._angle)
+            np.cos(self._angle, out=self._cos)
+            np.sin(self._angle, out=self._sin)
+            np.multiply(self.re, self._cos, out=self.out)
+            np.multiply(self.im, self._sin, out=self._sin)
+        np.add(self.out, self._sin, out=self.out)
+        return self.out
+
+
+class WindowIntegral():
+    '''
+    integrals of windows of one spectrum from prefix sums
+
+    set_spectrum() builds the cumulative sum of freq_y once per spectrum, the
+    complex integral of any window csL:csR is then a difference of two
+    entries, csL and csR can also be arrays for many regions at once;
+    the 0th order phased integral is Re(integral*exp(-1j*ph0)), also O(1),
+    a 1st order phase weights every point differently and needs the phased
+    spectrum itself
+    '''
+    def __init__(self):
+        self.prefix = np.zeros(1, dtype=np.complex128)
+
+    def set_spectrum(self, freq_y):
+        if len(self.prefix) != len(freq_y) + 1:
+            self.prefix = np.zeros(len(freq_y) + 1, dtype=np.complex128)
+        np.cumsum(freq_y, out=self.prefix[1:])
+
+    def integral(self, csL, csR):
+        return self.prefix[csR] - self.prefix[csL]
+
+    def magnitude(self, csL, csR):
+        return np.abs(self.integral(csL, csR))
+
+    def phased(self, csL, csR, ph0):
+        total = self.integral(csL, csR)
+        return total.real*np.cos(ph0) + total.imag*np.sin(ph0)
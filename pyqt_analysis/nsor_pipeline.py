@@ -0,0 +1,294 @@
+'''
+gui free processing pipeline
+
+load -> time cursor window -> apodization -> zerofill -> fft -> phase -> integral, the same
+steps MainWindow does on screen, for scripts and the command line:
+
+    python nsor_pipeline.py D:/Data/2018/Aug/0803 -o results.csv
+    python nsor_pipeline.py "D:/Data/2018/Aug/08*/NMR_sig*" --zero-fill x4 --jobs 0
+    python nsor_pipeline.py D:/Data/2018/Aug/0803 --arrayed --traces 16
+    python nsor_pipeline.py D:/Data/2018/Aug/0803 --window exponential --window-parameter 2
+
+the cursors, zerofilling and phase come from parameters.txt (as saved by the
+gui), options given on the command line override them
+'''
+import csv
+import glob
+import json
+import os
+import sys
+
+import numpy as np
+
+from nsor_data import AcquisitionFile, index_range, native_array
+from nsor_fft import ZERO_FILL_MODES, FFTBackend, zero_fill_length
+from nsor_phase import auto_phase_zeroth
+from nsor_window import WINDOWS, apodize
+
+PARAMETER_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'parameters.txt')
+FILE_PATTERN = 'NMR_sig*'
+RESULT_FIELDS = ['file', 'row', 'peak_intensity', 'phase', 'phased_integral', 'peak_frequency', 'snr', 'error']
+IN_FLIGHT = 2 # files submitted per worker process at a time, bounds the memory of a batch
+PROCESSING_KEYS = ['zero_fill', 'zero_fill_mode', 'resolution', 'window', 'window_parameter', 'phase', 'data_type'] # parameters that are not cursors or limits
+
+DEFAULT_SETTINGS = {
+    'time_cursor': [0.002, 0.6],
+    'freq_cursor': [31100, 31300],
+    'freq_x_limit': [31000, 31400],
+    'zero_fill': 'x1',
+    'zero_fill_mode': '2^n',
+    'resolution': '',
+    'window': 'none',
+    'window_parameter': '',
+    'phase': 'auto',
+    'data_type': 'bin',
+}
+
+
+def read_settings(parameter_file=PARAMETER_FILE, **overrides):
+    '''
+    processing settings from a gui parameter file, numbers converted, keys
+    missing in the file fall back to DEFAULT_SETTINGS, overrides that are
+    not None win over both
+    '''
+    settings = dict(DEFAULT_SETTINGS)
+    if parameter_file is not None and os.path.exists(parameter_file):
+        with open(parameter_file, 'r') as f:
+            parameters = json.load(f)
+        for key in settings:
+            if key in parameters:
+                settings[key] = parameters[key]
+    for key, val in overrides.items():
+        if val is not None:
+            settings[key] = val
+    for key in ['time_cursor', 'freq_cursor', 'freq_x_limit']:
+        settings[key] = [float(x) for x in settings[key]]
+    return settings
+
+
+def find_files(paths, pattern=FILE_PATTERN):
+    '''
+    files given directly, by glob, or as directories (files matching pattern)
+    '''
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(glob.glob(os.path.join(path, pattern)))
+        elif os.path.isfile(path):
+            files.append(path)
+        else:
+            files += sorted(glob.glob(path))
+    return [f for f in files if os.path.isfile(f)]
+
+
+def process(acquisition, settings, backend=None):
+    '''
+    run the pipeline on one AcquisitionFile, returns a dict of RESULT_FIELDS
+
+    peak_intensity is |integral| over the freq cursors and phased_integral the
+    phased one, both as the gui shows them, phase is in degrees, snr is the
+    phased peak height over the noise of the freq x limit outside the cursors
+    '''
+    if backend is None:
+        backend = FFTBackend()
+    cs1, cs2 = index_range(acquisition.time_axis, *settings['time_cursor'])
+    resolution = settings['resolution']
+    l = zero_fill_length(cs2-cs1, int(settings['zero_fill'][1:]), settings['zero_fill_mode'],
+                         float(resolution) if resolution else None, acquisition.dt)
+    time_sig = apodize_settings(acquisition.window(cs1, cs2, l), cs2-cs1, settings, acquisition.dt)
+    freq_x, freq_y = backend.spectrum(time_sig, acquisition.f_max)
+    return spectrum_results(freq_x, freq_y, settings)
+
+
+def apodize_settings(time_sig, n, settings, dt):
+    '''
+    window of settings applied in place to the first n points (before the zero fill)
+    '''
+    parameter = settings['window_parameter']
+    return apodize(time_sig, n, settings['window'], float(parameter) if parameter else None, dt)
+
+
+def spectrum_results(freq_x, freq_y, settings):
+    '''
+    phase, integral and snr of a spectrum, see process
+
+    the rows of a 2-D freq_y (arrayed data) are evaluated together, they
+    share one phase and every other result is an array with one value per row
+    '''
+    csL, csR = index_range(freq_x, *settings['freq_cursor'])
+    csR = max(csR, csL + 1)
+    if str(settings['phase']) == 'auto':
+        phi = auto_phase_zeroth(freq_y, csL, csR)
+    else:
+        phi = np.radians(float(settings['phase']))
+    lmL, lmR = index_range(freq_x, *settings['freq_x_limit'])
+    def phased(y):
+        return y.real*np.cos(phi) + y.imag*np.sin(phi)
+    window = freq_y[..., csL:csR]
+    peak = phased(window)
+    noise = phased(np.concatenate([freq_y[..., lmL:min(csL, lmR+1)], freq_y[..., max(csR, lmL):lmR+1]], axis=-1))
+    if noise.shape[-1] > 1:
+        snr = np.max(peak, axis=-1)/np.std(noise, axis=-1)
+    else:
+        snr = np.full(peak.shape[:-1], np.nan)
+    results = {
+        'peak_intensity': np.abs(np.sum(window, axis=-1)),
+        'phase': np.degrees(phi),
+        'phased_integral': np.sum(peak, axis=-1)*2,
+        'peak_frequency': freq_x[csL + np.argmax(peak, axis=-1)],
+        'snr': snr,
+    }
+    return {key: np.asarray(val).tolist() for key, val in results.items()} # floats, or lists for arrayed data
+
+
+def process_arrayed(traces, time_axis, f_max, settings, backend=None):
+    '''
+    run the pipeline on arrayed data, traces are the repeated fids (1-D
+    arrays or memmaps) sharing time_axis
+
+    the cursor windows of all traces go into one 2-D array that is transformed
+    with a single batched rfft and integrated row by row in one operation,
+    returns the results of spectrum_results with one value per trace
+    '''
+    if backend is None:
+        backend = FFTBackend()
+    cs1, cs2 = index_range(time_axis, *settings['time_cursor'])
+    resolution = settings['resolution']
+    l = zero_fill_length(cs2-cs1, int(settings['zero_fill'][1:]), settings['zero_fill_mode'],
+                         float(resolution) if resolution else None, 1/(2*f_max))
+    time_sig = apodize_settings(native_array(traces, cs1, cs2, l), cs2-cs1, settings, 1/(2*f_max))
+    freq_x, freq_y = backend.spectrum(time_sig, f_max)
+    return spectrum_results(freq_x, freq_y, settings)
+
+
+def process_arrayed_files(file_names, settings, backend=None, n_traces=1):
+    '''
+    one row of results per trace, the files (each holding n_traces fids) are
+    processed as one arrayed data set and must share the sampling
+    '''
+    acquisitions = [AcquisitionFile(f, settings['data_type']) for f in file_names]
+    if len(set(a.dt for a in acquisitions)) > 1:
+        raise ValueError('arrayed files need the same sampling')
+    traces, names = [], []
+    for acquisition in acquisitions:
+        traces += acquisition.traces(n_traces)
+        names += [acquisition.file_name]*n_traces
+    time_axis = acquisitions[0].time_axis[:len(traces[0])]
+    results = process_arrayed(traces, time_axis, acquisitions[0].f_max, settings, backend)
+    for row, name in enumerate(names):
+        result = {key: val[row] if isinstance(val, list) else val for key, val in results.items()}
+        result['file'] = name
+        result['row'] = row
+        yield result
+
+
+def process_file(file_name, settings, backend=None):
+    '''
+    results of one file, a file that fails gives a row with only the error
+    so that a long batch goes on
+    '''
+    try:
+        result = process(AcquisitionFile(file_name, settings['data_type']), settings, backend)
+    except Exception as e:
+        result = {'error': f'{type(e).__name__}: {e}'}
+    result['file'] = file_name
+    return result
+
+
+def write_results(results, output):
+    '''
+    results table as csv, output is a file object, every row is flushed as
+    soon as it is written
+    '''
+    writer = csv.DictWriter(output, RESULT_FIELDS)
+    writer.writeheader()
+    for result in results:
+        writer.writerow(result)
+        output.flush()
+
+
+'''
+multi process batch
+'''
+_worker_backend = None
+
+def _init_worker(backend_name):
+    # one fft backend per process, its plans are reused for every file
+    global _worker_backend
+    _worker_backend = FFTBackend(backend_name, workers=1)
+
+def _process_in_worker(file_name, settings):
+    return process_file(file_name, settings, _worker_backend)
+
+def run_batch(files, settings, jobs=None, backend_name=None, in_flight=IN_FLIGHT):
+    '''
+    process files on jobs worker processes (all cores if None), yields the
+    results in the order they finish
+
+    only in_flight files per process are submitted at a time, so the memory
+    of a batch does not grow with the number of files
+    '''
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait # imports multiprocessing, only needed here
+    files = iter(files)
+    jobs = jobs or os.cpu_count() or 1
+    limit = jobs*in_flight
+    with ProcessPoolExecutor(jobs, initializer=_init_worker, initargs=(backend_name,)) as pool:
+        pending = set()
+        for file_name in files:
+            pending.add(pool.submit(_process_in_worker, file_name, settings))
+            if len(pending) >= limit:
+                break
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+                file_name = next(files, None)
+                if file_name is not None:
+                    pending.add(pool.submit(_process_in_worker, file_name, settings))
+
+
+def parse_args(argv=None):
+    import argparse # command line only, keeps the import of the module fast
+    parser = argparse.ArgumentParser(description='batch fft, phase and integral of acquisition files')
+    parser.add_argument('paths', nargs='+', help='files, globs or directories of acquisitions')
+    parser.add_argument('-p', '--parameters', default=PARAMETER_FILE, help='gui parameter file with the cursors')
+    parser.add_argument('-o', '--output', help='csv file for the results table, stdout if omitted')
+    parser.add_argument('--pattern', default=FILE_PATTERN, help='file pattern inside directories')
+    parser.add_argument('--data-type', choices=['bin', '.npy'])
+    parser.add_argument('--zero-fill', choices=['x1', 'x2', 'x4', 'x8'])
+    parser.add_argument('--zero-fill-mode', choices=ZERO_FILL_MODES)
+    parser.add_argument('--resolution', help='target frequency resolution (Hz)')
+    parser.add_argument('--window', choices=WINDOWS, help='apodization of the time cursor window')
+    parser.add_argument('--window-parameter', help='line broadening (Hz) or kaiser beta of the window')
+    parser.add_argument('--phase', help='auto or 0th order phase in degrees')
+    parser.add_argument('--backend', help='fft library, pyfftw, scipy or numpy')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='worker processes, 0 for all cores')
+    parser.add_argument('--arrayed', action='store_true', help='process all files as one arrayed data set (one batched fft)')
+    parser.add_argument('--traces', type=int, default=1, help='repeated fids stored in each file, for --arrayed')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    settings = read_settings(args.parameters, data_type=args.data_type, zero_fill=args.zero_fill,
+                             zero_fill_mode=args.zero_fill_mode, resolution=args.resolution,
+                             window=args.window, window_parameter=args.window_parameter, phase=args.phase)
+    files = find_files(args.paths, args.pattern)
+    if not files:
+        sys.exit('no acquisition files found')
+    if args.arrayed:
+        results = process_arrayed_files(files, settings, FFTBackend(args.backend), args.traces)
+    elif args.jobs == 1:
+        backend = FFTBackend(args.backend)
+        results = (process_file(f, settings, backend) for f in files)
+    else:
+        results = run_batch(files, settings, args.jobs or None, args.backend)
+    if args.output:
+        with open(args.output, 'w', newline='') as f:
+            write_results(results, f)
+    else:
+        write_results(results, sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+'''
+timing spans of the processing stages
+
+    with span('fft'):
+        ...
+
+records the duration of the block in the module wide profiler when it is
+enabled; disabled (the default) span() only returns a shared do nothing
+context manager, so the spans stay in the hot paths; the gui shows the
+latency histograms of every stage and exports the spans as a chrome trace
+(chrome://tracing or https://ui.perfetto.dev)
+'''
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+STAGES = ['load', 'slice', 'pad', 'fft', 'phase', 'integral', 'decimate', 'render']
+SPAN_HISTORY = 2000 # durations kept per stage for the histograms
+TRACE_EVENTS = 200000 # spans kept for the trace export
+
+
+class _NullSpan():
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Span():
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, self.start, time.perf_counter() - self.start)
+        return False
+
+
+class Profiler():
+    '''
+    self.durations[name] holds the latest durations (s) of a stage,
+    self.events the latest (name, start, duration, thread) of all stages,
+    self.count the number of spans ever recorded; spans may end in any
+    thread (the fft runs in the thread pool)
+    '''
+    def __init__(self, history=SPAN_HISTORY, trace_events=TRACE_EVENTS):
+        self.enabled = False
+        self.history = history
+        self.durations = {}
+        self.events = deque(maxlen=trace_events)
+        self.threads = {}
+        self.count = 0
+        self._lock = threading.Lock()
+        self.t0 = time.perf_counter()
+
+    def span(self, name):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name)
+
+    def record(self, name, start, duration):
+        thread = threading.current_thread()
+        with self._lock:
+            if name not in self.durations:
+                self.durations[name] = deque(maxlen=self.history)
+            self.durations[name].append(duration)
+            self.events.append((name, start, duration, thread.ident))
+            self.threads[thread.ident] = thread.name
+            self.count += 1
+
+    def clear(self):
+        with self._lock:
+            self.durations = {}
+            self.events.clear()
+            self.count += 1 # the histograms change too
+
+    def samples(self, name):
+        '''
+        recorded durations of stage name in ms
+        '''
+        with self._lock:
+            return np.array(self.durations.get(name, ()))*1e3
+
+    def summary(self, name):
+        '''
+        (count, p50, p90, p99) of stage name in ms, None if never recorded
+        '''
+        samples = self.samples(name)
+        if not len(samples):
+            return None
+        return (len(samples),) + tuple(np.percentile(samples, [50, 90, 99]))
+
+    def chrome_trace(self):
+        '''
+        the recorded spans as chrome trace events, complete ('X') events in us
+        '''
+        pid = os.getpid()
+        with self._lock:
+            events = list(self.events)
+            threads = dict(self.threads)
+        trace = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+                 for tid, name in threads.items()]
+        trace += [{'name': name, 'cat': 'nsor', 'ph': 'X', 'pid': pid, 'tid': tid,
+                   'ts': (start - self.t0)*1e6, 'dur': duration*1e6}
+                  for name, start, duration, tid in events]
+        return {'traceEvents': trace, 'displayTimeUnit': 'ms'}
+
+    def export(self, file_name):
+        with open(file_name, 'w') as f:
+            json.dump(self.chrome_trace(), f)
+
+
+profiler = Profiler()
+
+
+def span(name):
+    return profiler.span(name)
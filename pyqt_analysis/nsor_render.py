@@ -0,0 +1,300 @@
+'''
+level of detail plotting of long traces
+
+a MinMaxPyramid keeps, for blocks of leaf, 2*leaf, 4*leaf ... samples, the
+indices of the smallest and largest sample of every block; a DecimatedLine
+plots only the min and max of blocks about one pixel wide in the visible x
+range, at their true positions, so peaks and the envelope look exactly as
+with every sample plotted, and refines itself when the x limits change
+
+RenderManager replaces ax.clear() + canvas.draw(): the artists stay, an axes
+whose data or limits changed is drawn again alone and animated artists
+(cursors, a dragged line) are blitted on a cached background of their axes
+'''
+import numpy as np
+from matplotlib.patches import Rectangle
+from matplotlib.transforms import Bbox, IdentityTransform
+
+from nsor_data import index_range
+from nsor_profile import span
+
+LEAF = 8 # samples per block of the finest level
+CHUNK = 1 << 20 # samples read at a time when the finest level is built
+
+
+def minmax_indices(y, i0, i1, width):
+    '''
+    indices of the min and max of every block of y[i0:i1] about one pixel
+    wide, in order, straight from the samples; for data that changes on every
+    frame (the phased spectrum), where a pyramid would have to be rebuilt
+    '''
+    count = i1 - i0
+    size = count//max(int(width), 1)
+    if size < 2:
+        return np.arange(i0, i1)
+    m = -(-count//size)
+    rows = np.empty(m*size)
+    rows[:count] = y[i0:i1]
+    rows[count:] = y[i1-1] # the partial last block repeats its last sample
+    rows = rows.reshape(m, size)
+    offset = i0 + size*np.arange(m)
+    imin = np.minimum(offset + np.argmin(rows, axis=1), i1 - 1)
+    imax = np.minimum(offset + np.argmax(rows, axis=1), i1 - 1)
+    index = np.empty(2*m, dtype=np.int64)
+    np.minimum(imin, imax, out=index[0::2])
+    np.maximum(imin, imax, out=index[1::2])
+    return index
+
+
+class MinMaxPyramid():
+    '''
+    self.sizes[k] is the block size of level k, self.levels[k] the (imin, imax)
+    index arrays of its blocks, the last block of a level may be partial
+    '''
+    def __init__(self, y, leaf=LEAF, factor=2, chunk=CHUNK):
+        self.n = len(y)
+        self.sizes = []
+        self.levels = []
+        if self.n < 2*leaf:
+            return
+        m = -(-self.n//leaf)
+        imin = np.empty(m, dtype=np.int64)
+        imax = np.empty(m, dtype=np.int64)
+        chunk = chunk//leaf*leaf
+        for start in range(0, self.n, chunk): # a memmap is read chunk by chunk
+            block = np.asarray(y[start:start+chunk], dtype=np.float64)
+            full = len(block)//leaf*leaf
+            b = start//leaf
+            offset = start + leaf*np.arange(full//leaf)
+            rows = block[:full].reshape(-1, leaf)
+            imin[b:b+len(rows)] = offset + np.argmin(rows, axis=1)
+            imax[b:b+len(rows)] = offset + np.argmax(rows, axis=1)
+            if full < len(block):
+                imin[-1] = start + full + np.argmin(block[full:])
+                imax[-1] = start + full + np.argmax(block[full:])
+        size = leaf
+        while True:
+            self.sizes.append(size)
+            self.levels.append((imin, imax))
+            if len(imin) < 2*factor:
+                break
+            imin = self._reduce(y, imin, factor, np.argmin)
+            imax = self._reduce(y, imax, factor, np.argmax)
+            size *= factor
+
+    @classmethod
+    def from_levels(cls, n, sizes, levels):
+        '''
+        pyramid of n samples from stored block sizes and (imin, imax) levels,
+        e.g. the memmaps of a sidecar entry (nsor_cache)
+        '''
+        pyramid = cls.__new__(cls)
+        pyramid.n = n
+        pyramid.sizes = list(sizes)
+        pyramid.levels = list(levels)
+        return pyramid
+
+    @staticmethod
+    def _reduce(y, index, factor, arg):
+        m = -(-len(index)//factor)
+        rows = np.empty(m*factor, dtype=np.int64)
+        rows[:len(index)] = index
+        rows[len(index):] = index[-1] # the partial last group repeats its last block
+        rows = rows.reshape(m, factor)
+        pick = arg(np.asarray(y[rows.ravel()], dtype=np.float64).reshape(m, factor), axis=1)
+        return rows[np.arange(m), pick]
+
+    def indices(self, i0, i1, width):
+        '''
+        indices of the samples to plot for y[i0:i1] on width pixels, the min and
+        max of every block of the coarsest level with at least one block per
+        pixel, in order; all of i0..i1 when zoomed in closer than the finest level
+        '''
+        count = i1 - i0
+        k = len(self.sizes) - 1
+        while k >= 0 and self.sizes[k] > count/max(width, 1):
+            k -= 1
+        if k < 0:
+            return np.arange(i0, i1)
+        size = self.sizes[k]
+        imin, imax = self.levels[k]
+        imin = imin[i0//size:-(-i1//size)]
+        imax = imax[i0//size:-(-i1//size)]
+        index = np.empty(2*len(imin), dtype=np.int64)
+        np.minimum(imin, imax, out=index[0::2])
+        np.maximum(imin, imax, out=index[1::2])
+        return index
+
+
+class DecimatedLine():
+    '''
+    persistent Line2D on ax showing y against x (array or UniformAxis) with
+    about two points per pixel of the visible x range, refined on every xlim
+    change and resize
+
+    live data (set_data(..., live=True)) changes in place between frames, it
+    is decimated from its visible samples on every refine instead of from a
+    pyramid, set_ydata() hands over the new samples and refines
+    '''
+    def __init__(self, ax, **kwargs):
+        self.ax = ax
+        self.x = None
+        self.y = None
+        self.line, = ax.plot([], [], **kwargs)
+        ax.callbacks.connect('xlim_changed', self.refine)
+        ax.figure.canvas.mpl_connect('resize_event', self.refine)
+
+    def set_data(self, x, y, pyramid=None, live=False):
+        '''
+        pyramid is the MinMaxPyramid of y if it is already known
+        '''
+        self.x = x
+        self.y = y
+        if live:
+            self.pyramid = None
+        else:
+            self.pyramid = MinMaxPyramid(y) if pyramid is None else pyramid
+        self.line.set_data(*self.visible(0, len(y)))
+
+    def set_ydata(self, y):
+        self.y = y
+        self.refine()
+
+    def visible(self, i0, i1):
+        if self.pyramid is None:
+            index = minmax_indices(self.y, i0, i1, self.ax.bbox.width)
+        else:
+            index = self.pyramid.indices(i0, i1, self.ax.bbox.width)
+        return np.asarray(self.x[index]), np.asarray(self.y[index])
+
+    def refine(self, event=None):
+        if self.y is None or not self.line.get_visible():
+            return
+        with span('decimate'):
+            x0, x1 = self.ax.get_xlim()
+            i0, i1 = index_range(self.x, x0, x1)
+            self.line.set_data(*self.visible(max(i0 - 1, 0), min(i1 + 2, len(self.y)))) # one sample beyond each edge
+
+
+class RenderManager():
+    '''
+    batched redraws of the axes (dict key: ax) of a canvas
+
+    invalidate(key) is for an axes whose data, limits or static artists
+    changed, the axes alone (ticks and labels included) is drawn again;
+    update(key) only restores its cached background and draws its animated
+    artists; requests are collected and painted by flush() once per event
+    loop turn, however many arrive in between
+    '''
+    def __init__(self, canvas, axes):
+        self.canvas = canvas
+        self.axes = axes
+        self.animated = {key: [] for key in axes}
+        self.backgrounds = {}
+        self.extents = {} # tight bbox of every axes when it was last drawn
+        self.invalid = set()
+        self.stale = set()
+        self.pending = False
+        # paints the figure colour over an axes before it is drawn again
+        self.eraser = Rectangle((0, 0), 0, 0, transform=IdentityTransform(),
+                                facecolor=canvas.figure.get_facecolor(), edgecolor='none')
+        self.eraser.set_figure(canvas.figure)
+        self.timer = canvas.new_timer(interval=0)
+        self.timer.single_shot = True
+        self.timer.add_callback(self.flush)
+        canvas.mpl_connect('draw_event', self._on_draw)
+
+    def key(self, ax):
+        for key, val in self.axes.items():
+            if val is ax:
+                return key
+
+    def add_animated(self, key, artist):
+        artist.set_animated(True)
+        if artist not in self.animated[key]:
+            self.animated[key].append(artist)
+
+    def remove_animated(self, key, artist):
+        artist.set_animated(False)
+        if artist in self.animated[key]:
+            self.animated[key].remove(artist)
+
+    def autoscale(self, key, *lines):
+        '''
+        limits of the axes from lines only (the cursors do not count), as
+        ax.clear() + ax.plot() used to give
+        '''
+        ax = self.axes[key]
+        ax.dataLim.set_points(Bbox.null().get_points())
+        ax.ignore_existing_data_limits = True
+        for line in lines:
+            xy = np.column_stack(line.get_data())
+            if len(xy):
+                ax.update_datalim(xy)
+        ax.set_autoscale_on(True)
+        ax.autoscale_view()
+        self.invalidate(key)
+
+    def invalidate(self, key):
+        self.invalid.add(key)
+        self._schedule()
+
+    def update(self, key):
+        self.stale.add(key)
+        self._schedule()
+
+    def _schedule(self):
+        if not self.pending:
+            self.pending = True
+            self.timer.start()
+
+    def flush(self):
+        self.pending = False
+        invalid, stale = self.invalid, self.stale - self.invalid
+        self.invalid, self.stale = set(), set()
+        if not invalid and not stale:
+            return
+        with span('render'):
+            if len(self.backgrounds) < len(self.axes): # never drawn yet
+                self.canvas.draw()
+                return
+            regions = self._redraw(invalid) if invalid else []
+            for key in stale:
+                self.canvas.restore_region(self.backgrounds[key])
+                self._draw_animated(key)
+                regions.append(self.axes[key].bbox)
+            for region in regions:
+                self.canvas.blit(region)
+
+    def _redraw(self, keys):
+        renderer = self.canvas.get_renderer()
+        erase = {}
+        for key in keys:
+            erase[key] = Bbox.union([self.extents[key], self.axes[key].get_tightbbox(renderer)]).padded(2)
+        # an axes reaching into an erased region has to be drawn again too
+        for key in self.axes:
+            if key not in erase and any(self.extents[key].overlaps(e) for e in list(erase.values())):
+                erase[key] = self.extents[key].padded(2)
+        for region in erase.values():
+            self.eraser.set_bounds(region.x0, region.y0, region.width, region.height)
+            self.eraser.draw(renderer)
+        regions = []
+        for key, region in erase.items():
+            ax = self.axes[key]
+            ax.draw(renderer) # animated artists are skipped
+            self.extents[key] = ax.get_tightbbox(renderer)
+            self.backgrounds[key] = self.canvas.copy_from_bbox(ax.bbox)
+            self._draw_animated(key)
+            regions.append(Bbox.union([region, self.extents[key]]))
+        return regions
+
+    def _draw_animated(self, key):
+        for artist in self.animated[key]:
+            self.axes[key].draw_artist(artist)
+
+    def _on_draw(self, event):
+        # a full canvas draw (first show, resize, flush) renews every background
+        for key, ax in self.axes.items():
+            self.extents[key] = ax.get_tightbbox(event.renderer)
+            self.backgrounds[key] = self.canvas.copy_from_bbox(ax.bbox)
+            self._draw_animated(key)
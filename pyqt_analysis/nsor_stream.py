@@ -0,0 +1,241 @@
+'''
+live acquisition input
+
+a digitiser (or the stand-in writer below) appends x/y records in the
+labview bin format (big endian float64 pairs) to a growing file, a named pipe
+or a socket; a StreamSource reads the complete records that arrived since the
+last poll without blocking, RingBuffer keeps the latest samples
+
+    python nsor_stream.py D:/Data/live/NMR_sig --rate 100000 --chunk 10000
+    python nsor_stream.py --port 5025
+'''
+import argparse
+import os
+import socket
+import stat
+import time
+
+import numpy as np
+from numpy import pi
+
+RECORD_BYTES = 16 # one x/y pair of '>f8'
+STREAM_CAPACITY = 2**20 # samples kept by the gui
+
+
+class RingBuffer():
+    '''
+    the latest capacity samples of a stream, total counts every sample ever
+    appended
+    '''
+    def __init__(self, capacity=STREAM_CAPACITY):
+        self.capacity = capacity
+        self.buffer = np.zeros(capacity)
+        self.total = 0
+
+    def __len__(self):
+        return min(self.total, self.capacity)
+
+    def append(self, chunk):
+        n = len(chunk)
+        chunk = chunk[-self.capacity:] # older samples would be overwritten anyway
+        start = (self.total + n - len(chunk)) % self.capacity
+        end = start + len(chunk)
+        if end <= self.capacity:
+            self.buffer[start:end] = chunk
+        else:
+            k = self.capacity - start
+            self.buffer[start:] = chunk[:k]
+            self.buffer[:end-self.capacity] = chunk[k:]
+        self.total += n
+
+    def values(self, out=None):
+        '''
+        the samples from oldest to newest as one contiguous array, written
+        into out when it has the right length
+        '''
+        n = len(self)
+        if out is None or len(out) != n:
+            out = np.empty(n)
+        start = self.total % self.capacity if self.total > self.capacity else 0
+        k = n - start
+        out[:k] = self.buffer[start:n]
+        out[k:] = self.buffer[:start]
+        return out
+
+
+class StreamSource():
+    '''
+    non blocking reader of x/y records, read() returns the new y samples
+    (possibly none), partial records are kept for the next read;
+    dt is known once two records arrived, closed is set at the end of a stream
+    subclasses implement _read_bytes() returning whatever bytes are available
+    '''
+    def __init__(self):
+        self._pending = b''
+        self._x = []
+        self.dt = None
+        self.closed = False
+
+    @property
+    def f_max(self):
+        return 1/(2*self.dt)
+
+    def read(self):
+        data = self._pending + self._read_bytes()
+        n = len(data)//RECORD_BYTES
+        self._pending = data[n*RECORD_BYTES:]
+        records = np.frombuffer(data[:n*RECORD_BYTES], dtype='>f8').reshape(-1, 2)
+        if self.dt is None and n:
+            self._x += records[:2, 0].tolist()
+            if len(self._x) >= 2:
+                self.dt = self._x[1] - self._x[0]
+        return records[:, 1].astype(np.float64)
+
+    def close(self):
+        self.closed = True
+
+
+class FileSource(StreamSource):
+    '''
+    tail of a growing bin file or a named pipe, a regular file that grew by
+    more than max_bytes since the last read is skipped ahead to its newest
+    records, so a slow reader does not fall further and further behind
+    '''
+    def __init__(self, file_name, max_bytes=RECORD_BYTES*STREAM_CAPACITY):
+        super(FileSource, self).__init__()
+        self.file_name = file_name
+        self.max_bytes = max_bytes
+        self.fd = os.open(file_name, os.O_RDONLY | getattr(os, 'O_NONBLOCK', 0) | getattr(os, 'O_BINARY', 0))
+        self.regular = stat.S_ISREG(os.fstat(self.fd).st_mode)
+
+    def _read_bytes(self):
+        if self.regular:
+            position = os.lseek(self.fd, 0, os.SEEK_CUR)
+            size = os.fstat(self.fd).st_size
+            if size - position > self.max_bytes:
+                self._pending = b''
+                os.lseek(self.fd, (size - self.max_bytes)//RECORD_BYTES*RECORD_BYTES, os.SEEK_SET)
+        try:
+            data = os.read(self.fd, self.max_bytes)
+        except BlockingIOError: # pipe without new data
+            return b''
+        except OSError: # file gone or unreadable, the stream ends
+            self.closed = True
+            return b''
+        if not data and not self.regular:
+            self.closed = True # writer closed the pipe
+        return data
+
+    def close(self):
+        super(FileSource, self).close()
+        os.close(self.fd)
+
+
+class SocketSource(StreamSource):
+    '''
+    records sent over a tcp connection
+    '''
+    def __init__(self, host, port):
+        super(SocketSource, self).__init__()
+        self.socket = socket.create_connection((host, port))
+        self.socket.setblocking(False)
+
+    def _read_bytes(self):
+        chunks = []
+        while True:
+            try:
+                data = self.socket.recv(1 << 20)
+            except BlockingIOError:
+                break
+            except OSError: # connection reset or aborted by the sender
+                self.closed = True
+                break
+            if not data:
+                self.closed = True
+                break
+            chunks.append(data)
+        return b''.join(chunks)
+
+    def close(self):
+        super(SocketSource, self).close()
+        self.socket.close()
+
+
+def open_source(target):
+    '''
+    'host:port' for a socket, anything else is a file or pipe
+    '''
+    host, _, port = target.rpartition(':')
+    if host and port.isdigit() and not os.path.exists(target):
+        return SocketSource(host, int(port))
+    return FileSource(target)
+
+
+'''
+stand-in for the digitiser
+'''
+def synthetic_records(start, n, dt, frequency=31200, period=1., t2=0.3, noise=0.01):
+    '''
+    records start..start+n of a stream of fids repeated every period seconds
+    '''
+    t = (start + np.arange(n))*dt
+    y = np.cos(2*pi*frequency*t)*np.exp(-(t % period)/t2) + noise*np.random.randn(n)
+    records = np.empty((n, 2), dtype='>f8')
+    records[:, 0] = t
+    records[:, 1] = y
+    return records.tobytes()
+
+
+def write_stream(file_name=None, port=None, rate=1e5, chunk=10000, duration=None, **kwargs):
+    '''
+    write synthetic records at rate samples per second, chunk samples at a
+    time, to file_name (appended) or to the first client connecting to port
+    '''
+    if port is not None:
+        server = socket.create_server(('localhost', port))
+        connection, _ = server.accept()
+        write = connection.sendall
+    else:
+        output = open(file_name, 'ab')
+        def write(data):
+            output.write(data)
+            output.flush()
+    dt = 1/rate
+    start = 0
+    t0 = time.perf_counter()
+    try:
+        while duration is None or start*dt < duration:
+            write(synthetic_records(start, chunk, dt, **kwargs))
+            start += chunk
+            time.sleep(max(t0 + start*dt - time.perf_counter(), 0)) # real time pace
+    except (BrokenPipeError, ConnectionResetError, KeyboardInterrupt):
+        pass
+    finally:
+        if port is not None:
+            connection.close()
+            server.close()
+        else:
+            output.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='synthetic live acquisition, appends fid records in the bin format')
+    parser.add_argument('file_name', nargs='?', help='file or named pipe written to')
+    parser.add_argument('--port', type=int, help='serve the records on this tcp port instead of a file')
+    parser.add_argument('--rate', type=float, default=1e5, help='samples per second')
+    parser.add_argument('--chunk', type=int, default=10000, help='samples per write')
+    parser.add_argument('--duration', type=float, help='seconds to write, forever if omitted')
+    parser.add_argument('--frequency', type=float, default=31200, help='signal frequency (Hz)')
+    args = parser.parse_args(argv)
+    if args.file_name is None and args.port is None:
+        parser.error('give a file name or --port')
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    write_stream(args.file_name, args.port, args.rate, args.chunk, args.duration, frequency=args.frequency)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+'''
+auto phase of synthetic lorentzian spectra with a known phase error
+
+    python -m pytest test_nsor_phase.py
+'''
+import numpy as np
+from numpy import pi
+
+from nsor_phase import PhaseCorrector, auto_phase_entropy, auto_phase_zeroth, phase_ramp
+
+N = 4096
+WIDTH = 4 # half width of the lines in points
+CURSOR = (1800, 2200)
+
+
+def spectrum(lines, ph0, ph1, noise=0., seed=0):
+    '''
+    absorption lorentzians at the points lines, turned by ph0 + ph1*ramp
+    (the pivot in the middle of CURSOR) and with complex gaussian noise
+    '''
+    f = np.arange(N)
+    y = sum(WIDTH/(WIDTH - 1j*(f - line)) for line in lines)
+    y = y*np.exp(1j*(ph0 + ph1*phase_ramp(N, sum(CURSOR)/2)))
+    rng = np.random.default_rng(seed)
+    return y + noise*(rng.standard_normal(N) + 1j*rng.standard_normal(N))
+
+
+def phase_error(a, b):
+    return abs((a - b + pi) % (2*pi) - pi)
+
+
+def test_zeroth():
+    assert phase_error(auto_phase_zeroth(spectrum([2000], 0.7, 0), *CURSOR), 0.7) < 1e-2
+
+
+def test_entropy_single_line():
+    ph0, ph1 = auto_phase_entropy(spectrum([2000], 0.7, 0), *CURSOR)
+    assert phase_error(ph0, 0.7) < 1e-2
+    assert abs(ph1) < 0.05
+
+
+def test_entropy_recovers_phases():
+    for ph0_true, ph1_true in [(0.7, 0.), (2.0, -1.5), (5.5, 2.), (0.01, -3.)]:
+        y = spectrum([1500, 1950, 2500], ph0_true, ph1_true, noise=1e-3)
+        ph0, ph1 = auto_phase_entropy(y, *CURSOR)
+        assert phase_error(ph0, ph0_true) < 2e-2
+        assert abs(ph1 - ph1_true) < 0.15
+        phased = PhaseCorrector()
+        phased.set_spectrum(y)
+        assert np.sum(phased.apply(ph0, ph1, sum(CURSOR)/2)[slice(*CURSOR)]) > 0
+
+
+def test_entropy_stays_in_grid():
+    grid = np.linspace(-0.5, 0.5, 11)
+    ph0, ph1 = auto_phase_entropy(spectrum([1500, 1950, 2500], 0.7, 2.), *CURSOR, ph1_grid=grid)
+    assert grid[0] <= ph1 <= grid[-1]